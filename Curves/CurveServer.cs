@@ -0,0 +1,61 @@
+using System.Diagnostics;
+using System.Text.Json;
+
+namespace F1_tyre_strategy.Curves;
+
+// Keeps one `get_curves.py --serve` process alive and sends it JSON-lines curve requests
+class CurveServer : IDisposable
+{
+    private readonly Process process;
+
+    public CurveServer(string pythonPath, string scriptPath)
+    {
+        var psi = new ProcessStartInfo
+        {
+            FileName = pythonPath,
+            Arguments = $"\"{scriptPath}\" --serve",
+            RedirectStandardInput = true,
+            RedirectStandardOutput = true,
+            RedirectStandardError = true,
+            UseShellExecute = false,
+            CreateNoWindow = true
+        };
+
+        process = Process.Start(psi) ?? throw new InvalidOperationException("Failed to start curve server");
+
+        // Drain stderr in the background so warnings can never block the server
+        process.ErrorDataReceived += (_, e) =>
+        {
+            if (!string.IsNullOrWhiteSpace(e.Data))
+                Console.WriteLine("Python errors: " + e.Data);
+        };
+        process.BeginErrorReadLine();
+    }
+
+    // Returns the raw JSON reply line for one (country, year, session type, compounds) request
+    public string Request(string country, int year, string sessionType, IEnumerable<string> compounds)
+    {
+        var request = JsonSerializer.Serialize(new
+        {
+            country,
+            year,
+            session_type = sessionType,
+            compounds
+        });
+
+        process.StandardInput.WriteLine(request);
+        process.StandardInput.Flush();
+
+        return process.StandardOutput.ReadLine()
+            ?? throw new InvalidOperationException("Curve server exited unexpectedly");
+    }
+
+    public void Dispose()
+    {
+        // Closing stdin ends the server's request loop
+        process.StandardInput.Close();
+        if (!process.WaitForExit(5000))
+            process.Kill();
+        process.Dispose();
+    }
+}
@@ -1,10 +1,10 @@
 ﻿namespace F1_tyre_strategy;
 
 using System;
-using System.Diagnostics;
 using System.Text.Json;
 using F1_tyre_strategy.Tyres;
 using F1_tyre_strategy.Strategy;
+using F1_tyre_strategy.Curves;
 
 class Program
 {
@@ -18,6 +18,7 @@ class Program
         if (curves.Count == 0)
         {
             Console.WriteLine("No curves returned from Python, exiting...");
+            curveServer?.Dispose();
             return;
         }
 
@@ -51,29 +52,17 @@ class Program
         {
             Console.WriteLine($"  - {stint}");
         }
+
+        curveServer?.Dispose();
     }
 
+    static CurveServer? curveServer;
+
     static Dictionary<string, Dictionary<string, JsonElement>> RunPython(string scriptPath)
     {
-        var psi = new ProcessStartInfo
-        {
-            FileName = "/opt/homebrew/bin/python3.11",
-            Arguments = scriptPath,
-            RedirectStandardOutput = true,
-            RedirectStandardError = true,
-            UseShellExecute = false,
-            CreateNoWindow = true
-        };
-
-        using var process = Process.Start(psi);
-        string output = process.StandardOutput.ReadToEnd();
-        string errors = process.StandardError.ReadToEnd();
-        process.WaitForExit();
-
-        if (!string.IsNullOrWhiteSpace(errors))
-        {
-            Console.WriteLine("Python errors: " + errors);
-        }
+        // One long-lived Python process answers every curve request, keeping its data warm
+        curveServer ??= new CurveServer("/opt/homebrew/bin/python3.11", scriptPath);
+        string output = curveServer.Request("Spain", 2024, "Practice", new[] { "SOFT", "MEDIUM", "HARD" });
 
         try
         {
@@ -0,0 +1,74 @@
+"""Compare size and read throughput of the cached JSON under each codec.
+
+Copies the laps/stints downloads from cache/ into a scratch directory once per
+codec and times reading them back the way get_curves.py does (a full
+json.load, and the projected streaming decode used for laps):
+
+    python bench_cache.py --repeat 5
+"""
+import os
+import re
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import get_curves as gc
+
+def read_all(paths):
+    for path in paths:
+        with gc.open_cached(path) as f:
+            json.load(f)
+
+def project_laps(paths):
+    for path in paths:
+        if os.path.basename(path).startswith("laps_"):
+            for _ in gc.iter_projected_records(path, gc.LAP_COLUMNS):
+                pass
+
+def best_of(repeat, fn, *args):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", default=gc.CACHE_DIR)
+    parser.add_argument("--codecs", nargs="+", default=["none", "gzip", "zstd"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    names = sorted(name for name in os.listdir(args.source)
+                   if re.fullmatch(r"(stints|laps)_\d+\.json(\.gz|\.zst)?", name))
+    raw_bytes = laps_bytes = 0
+    data = {}
+    for name in names:
+        fname = name.removesuffix(".gz").removesuffix(".zst")
+        with gc.open_cached(os.path.join(args.source, name)) as f:
+            text = f.read()
+        raw_bytes += len(text.encode())
+        if fname.startswith("laps_"):
+            laps_bytes += len(text.encode())
+        data[fname] = json.loads(text)
+
+    print(f"{len(data)} files, {raw_bytes / 1e6:.1f} MB of JSON")
+    print(f"{'codec':6} {'on disk':>9} {'ratio':>6} {'json.load':>11} {'projected':>11}")
+    for codec in args.codecs:
+        scratch = tempfile.mkdtemp(prefix="bench_cache_")
+        try:
+            gc.CACHE_DIR = scratch
+            paths = [gc.write_cached_json(fname, records, codec) for fname, records in data.items()]
+            disk = sum(os.path.getsize(path) for path in paths)
+            load = best_of(args.repeat, read_all, paths)
+            projected = best_of(args.repeat, project_laps, paths)
+        finally:
+            shutil.rmtree(scratch)
+        print(f"{codec:6} {disk / 1e6:7.2f}MB {raw_bytes / disk:5.1f}x "
+              f"{raw_bytes / 1e6 / load:7.1f}MB/s {laps_bytes / 1e6 / projected:7.1f}MB/s")
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,999 @@
+"""Fit tyre degradation curves (lap time vs tyre age) from OpenF1 practice data.
+
+Run as a script to print the per-compound curves as JSON for the C# solver,
+or import it and call the pipeline in-process; parsed sessions are kept in
+memory and reused across calls:
+
+    import get_curves as gc
+    stint_laps = gc.build_stint_laps(gc.load_sessions("Spain", 2024, "Practice"))
+    rows = gc.drop_anomalies(gc.fuel_correct(gc.filter_laps(stint_laps["SOFT"])))
+    ages, counts, means, _ = gc.aggregate_by_age(rows["tyre_age"], rows["fuel_corrected_time_zero"])
+    fit, x, y = gc.fit_curve(ages, counts, means)
+
+or, in one call, ``gc.compute_curves("Spain", 2024, "Practice", ["SOFT"], threshold=1.02)``.
+``gc.pooled_curves(session_keys, ["SOFT"])`` fits any set of sessions at once
+from their stored fuel-corrected laps.
+"""
 import os
+import re
+import io
+import gzip
+import codecs
+import contextlib
+import argparse
+import hashlib
+import sqlite3
+import subprocess
 import json
-import requests
-import certifi
-from collections import defaultdict
+import threading
+import time
+from datetime import datetime, timezone
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory
 import sys
+import warnings
+from typing import NamedTuple
+from urllib.parse import quote
 
 import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.linear_model import LinearRegression, RANSACRegressor, HuberRegressor
-from scipy.optimize import curve_fit
 
-# --- Setup cache and plots directories ---
-CACHE_DIR = "cache"
-os.makedirs(CACHE_DIR, exist_ok=True)
+# Heavy dependencies (requests/certifi, scipy, matplotlib) are imported inside
+# the functions that need them, so cached runs without plots start quickly.
 
+# --- Cache and plots directories (created on first write) ---
+CACHE_DIR = "cache"
 PLOTS_DIR = "plots"
-os.makedirs(PLOTS_DIR, exist_ok=True)
+# Codec for newly downloaded JSON: "none", "gzip" (.gz) or "zstd" (.zst, needs
+# the zstandard package). Cached files of any codec are read transparently.
+CACHE_COMPRESSION = os.environ.get("OPENF1_CACHE_COMPRESSION", "none")
+CACHE_SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
 
-# --- Fetch + cache function ---
-def fetch_and_cache(url, fname):
-    path = os.path.join(CACHE_DIR, fname)
+# --- HTTP client ---
+# Point OPENF1_API at a local stand-in (see openf1_stub.py) to run without the real API
+OPENF1_API = os.environ.get("OPENF1_API", "https://api.openf1.org/v1").rstrip("/")
+# Both are read on use, so callers can change them at any time
+FETCH_CONCURRENCY = 4    # parallel downloads sharing the pooled session
+FETCH_RATE_LIMIT = 3.0   # max requests started per second, 0 disables
 
-    if os.path.exists(path):
-        with open(path, "r") as f:
-            return json.load(f)
-        
-    response = requests.get(url, verify=certifi.where(), timeout=30)
+class RateLimiter:
+    """Spaces calls to ``wait`` at least ``1 / rate`` seconds apart across threads."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+_http_session = None
+_http_pool_size = None
+_http_lock = threading.Lock()
+_rate_limiter = None
+
+def get_http_session():
+    """The pooled session, rebuilt if FETCH_CONCURRENCY changed since it was made."""
+    global _http_session, _http_pool_size
+    with _http_lock:
+        if _http_session is None or _http_pool_size != FETCH_CONCURRENCY:
+            import certifi
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            if _http_session is not None:
+                _http_session.close()
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=FETCH_CONCURRENCY, pool_maxsize=FETCH_CONCURRENCY)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.verify = certifi.where()
+            _http_session, _http_pool_size = session, FETCH_CONCURRENCY
+    return _http_session
+
+def get_rate_limiter():
+    """The shared rate limiter, rebuilt if FETCH_RATE_LIMIT changed since it was made."""
+    global _rate_limiter
+    with _http_lock:
+        if _rate_limiter is None or _rate_limiter.rate != FETCH_RATE_LIMIT:
+            _rate_limiter = RateLimiter(FETCH_RATE_LIMIT)
+    return _rate_limiter
+
+# --- Compressed cache files ---
+def cached_path(fname):
+    """Path of ``fname`` in the cache under any codec, or None if it is not cached."""
+    for suffix in CACHE_SUFFIXES.values():
+        path = os.path.join(CACHE_DIR, fname + suffix)
+        if os.path.exists(path):
+            return path
+    return None
+
+def open_cached(path):
+    """Open a cached JSON file for reading as text, decompressing by its suffix."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt")
+    if path.endswith(".zst"):
+        import zstandard
+
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return io.TextIOWrapper(reader)
+    return open(path, "r")
+
+def cache_file_path(fname, codec=None):
+    return os.path.join(CACHE_DIR, fname + CACHE_SUFFIXES[codec or CACHE_COMPRESSION])
+
+@contextlib.contextmanager
+def writing_cache_file(fname, codec=None):
+    """Binary writer for ``fname`` in the cache, compressing with ``codec``.
+
+    The file appears atomically when the block exits cleanly, replacing any
+    other codec's copy; on an error the partial file is discarded.
+    """
+    codec = codec or CACHE_COMPRESSION
+    path = cache_file_path(fname, codec)
+    # Write to a temporary file first so concurrent readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as raw:
+            if codec == "gzip":
+                # No name or mtime in the header keeps the bytes (and so the
+                # result cache key) independent of when and where it was written
+                with gzip.GzipFile(filename="", fileobj=raw, mode="wb", mtime=0) as f:
+                    yield f
+            elif codec == "zstd":
+                import zstandard
+
+                with zstandard.ZstdCompressor(level=10).stream_writer(raw, closefd=False) as f:
+                    yield f
+            else:
+                yield raw
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    for suffix in CACHE_SUFFIXES.values():
+        other_path = os.path.join(CACHE_DIR, fname + suffix)
+        if other_path != path and os.path.exists(other_path):
+            os.remove(other_path)
+
+def write_cached_json(fname, data, codec=None):
+    """Atomically write ``data`` as ``fname`` in the cache; returns its path."""
+    with writing_cache_file(fname, codec) as f:
+        f.write(json.dumps(data).encode())
+    return cache_file_path(fname, codec)
+
+def compress_cache(codec):
+    """Rewrite every cached JSON download with ``codec``; returns (bytes before, bytes after)."""
+    before = after = 0
+    for name in sorted(os.listdir(CACHE_DIR)) if os.path.isdir(CACHE_DIR) else []:
+        match = re.fullmatch(r"((?:sessions|stints|laps)_.+\.json)(\.gz|\.zst)?", name)
+        if not match:
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        size = os.path.getsize(path)
+        if (match.group(2) or "") == CACHE_SUFFIXES[codec]:
+            before += size
+            after += size
+            continue
+        mtime = os.path.getmtime(path)
+        with open_cached(path) as f:
+            data = json.load(f)
+        new_path = write_cached_json(match.group(1), data, codec)
+        # Keep the mtime, so derived .npz copies and sync's freshness checks stay valid
+        os.utime(new_path, (mtime, mtime))
+        before += size
+        after += os.path.getsize(new_path)
+    return before, after
+
+# --- Fetch + cache functions ---
+def fetch_json(url):
+    """GET ``url`` through the pooled, rate-limited session and decode the JSON body."""
+    get_rate_limiter().wait()
+    response = get_http_session().get(url, timeout=30)
     response.raise_for_status()
-    data = response.json()
+    return response.json()
+
+# When each cached file was last downloaded, so sync can tell live data from final
+FETCH_LOG_PATH = os.path.join(CACHE_DIR, "fetch_log.json")
+_fetch_log_lock = threading.Lock()
+
+def read_fetch_log():
+    try:
+        with open(FETCH_LOG_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def record_fetch(fname, fetched_at):
+    with _fetch_log_lock:
+        log = read_fetch_log()
+        log[fname] = fetched_at
+        tmp_path = f"{FETCH_LOG_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(log, f, indent=0, sort_keys=True)
+        os.replace(tmp_path, FETCH_LOG_PATH)
+
+def stream_to_cache(url, fname, chunk_size=1 << 16):
+    """Download ``url`` into the cache as ``fname``, yielding each raw chunk as it is written.
+
+    The body is never held in memory as a whole, nor decoded and re-encoded.
+    The file only appears, and the fetch is logged, once the generator is
+    exhausted, so a failed or abandoned download leaves nothing behind.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fetched_at = time.time()
+    get_rate_limiter().wait()
+    with get_http_session().get(url, timeout=30, stream=True) as response:
+        response.raise_for_status()
+        with writing_cache_file(fname) as f:
+            for chunk in response.iter_content(chunk_size):
+                f.write(chunk)
+                yield chunk
+    record_fetch(fname, fetched_at)
+
+def download_to_cache(url, fname, refresh=False):
+    """Download ``url`` to ``fname`` in the cache unless it is already there (or ``refresh``)."""
+    path = cached_path(fname)
+    if path and not refresh:
+        return path
+
+    for _ in stream_to_cache(url, fname):
+        pass
+    return cache_file_path(fname)
+
+def fetch_and_cache(url, fname):
+    path = download_to_cache(url, fname)
+    with open_cached(path) as f:
+        return json.load(f)
+
+def prefetch(targets, concurrency=None):
+    """Download every missing ``(url, fname)`` pair in ``targets`` in parallel."""
+    targets = [(url, fname) for url, fname in targets
+               if not cached_path(fname)]
+    if not targets:
+        return
+    with ThreadPoolExecutor(max_workers=concurrency or FETCH_CONCURRENCY) as pool:
+        # list() re-raises the first download error, if any
+        list(pool.map(lambda target: download_to_cache(*target), targets))
+
+def session_targets(session):
+    return [
+        (f"{OPENF1_API}/stints?session_key={session}", f"stints_{session}.json"),
+        (f"{OPENF1_API}/laps?session_key={session}", f"laps_{session}.json"),
+    ]
+
+# --- Projected JSON decoding ---
+# Matches a field whose value is a flat list, e.g. the segments_sector_* arrays
+_FLAT_LIST_FIELD = re.compile(r'"(\w+)"\s*:\s*\[[^\[\]]*\]')
+
+def iter_projected_records(path, fields, chunk_size=1 << 18):
+    """Stream the objects of a top-level JSON array file, keeping only ``fields``."""
+    with open_cached(path) as f:
+        yield from project_records(iter(lambda: f.read(chunk_size), ""), fields, path)
+
+def project_records(chunks, fields, source="input"):
+    """Decode the objects of a top-level JSON array from text ``chunks``, keeping only ``fields``.
+
+    Objects are decoded one at a time as the chunks arrive. List values of
+    fields outside ``fields`` are rewritten to null before decoding, so their
+    elements are never materialised as Python objects.
+    """
+    fields = tuple(fields)
+    keep = set(fields)
+
+    def drop_list(match):
+        return match.group(0) if match.group(1) in keep else f'"{match.group(1)}":null'
+
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buf, pos = "", 0
+    started = eof = False
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buf):
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError(f"{source} does not contain a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                record, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Incomplete object at the end of the buffer: read more
+                if eof:
+                    raise
+            else:
+                yield {name: record.get(name) for name in fields}
+                continue
+        elif eof:
+            raise ValueError(f"{source} ended before the JSON array was closed")
+
+        chunk = next(chunks, "")
+        eof = not chunk
+        buf, pos = _FLAT_LIST_FIELD.sub(drop_list, buf[pos:] + chunk), 0
+
+# --- Columnar laps cache ---
+# Typed per-lap columns kept in cache/laps_<session>.npz next to the raw JSON,
+# so later runs skip json.load on the large laps files entirely.
+LAP_COLUMNS = {
+    "driver_number": np.int32,
+    "lap_number": np.int32,
+    "duration_sector_1": np.float64,
+    "duration_sector_2": np.float64,
+    "duration_sector_3": np.float64,
+    "lap_duration": np.float64,
+    "is_pit_out_lap": np.bool_,
+    "i1_speed": np.float64,
+    "i2_speed": np.float64,
+    "st_speed": np.float64,
+}
+
+def laps_to_columns(laps):
+    values = {name: [] for name in LAP_COLUMNS}
+    for lap in laps:
+        # Laps without a driver or lap number can never be joined to a stint
+        if lap.get("driver_number") is None or lap.get("lap_number") is None:
+            continue
+        for name, column in values.items():
+            column.append(lap.get(name))
+
+    columns = {}
+    for name, dtype in LAP_COLUMNS.items():
+        column = values.pop(name)
+        if dtype is np.float64:
+            column = [np.nan if v is None else v for v in column]
+        elif dtype is np.bool_:
+            column = [bool(v) for v in column]
+        columns[name] = np.array(column, dtype=dtype)
+    return columns
+
+def load_laps(session):
+    json_path = cached_path(f"laps_{session}.json")
+    npz_path = os.path.join(CACHE_DIR, f"laps_{session}.npz")
+
+    # Rebuild the columnar copy whenever the raw JSON is newer than it
+    if os.path.exists(npz_path) and (json_path is None
+                                     or os.path.getmtime(npz_path) >= os.path.getmtime(json_path)):
+        with np.load(npz_path) as data:
+            return {name: data[name] for name in LAP_COLUMNS}
+
+    if json_path is not None:
+        # json.load is about twice as fast as the projected decoder on a file already on disk
+        with open_cached(json_path) as f:
+            columns = laps_to_columns(json.load(f))
+    else:
+        # Decode the columns from the response as it streams to disk, in one pass
+        chunks = stream_to_cache(f"{OPENF1_API}/laps?session_key={session}", f"laps_{session}.json")
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        text = (decoder.decode(chunk) for chunk in chunks)
+        columns = laps_to_columns(project_records(text, LAP_COLUMNS, f"laps_{session}"))
+        # Anything after the closing bracket, which also finishes the download
+        for _ in chunks:
+            pass
+
+    tmp_path = npz_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **columns)
+    os.replace(tmp_path, npz_path)
+
+    return columns
+
+# --- Stint/lap join ---
+STINT_LAP_COLUMNS = ["lap_time", "tyre_age", "driver", "session", "lap_number", "stint_start",
+                     "stint_end", "stint_length", "tyre_age_at_start", "stint_number"]
+
+def build_lap_index(laps):
+    """Index lap rows densely by (driver slot, lap number).
+
+    Returns the sorted driver numbers (slot i holds ``drivers[i]``) and a 2D
+    array of row offsets into the lap columns, -1 where a lap is missing. When
+    a (driver, lap) pair appears twice the later row wins.
+    """
+    drivers, slot = np.unique(laps["driver_number"], return_inverse=True)
+    lap_number = laps["lap_number"]
+    index = np.full((len(drivers), int(lap_number.max()) + 1), -1, dtype=np.int64)
+    np.maximum.at(index, (slot.reshape(-1), lap_number), np.arange(len(lap_number)))
+    return drivers, index
+
+def usable_stints(stints):
+    """Yield (driver, stint_number, lap_start, lap_end, compound, tyre_age_at_start) per usable stint.
+
+    Stints without a compound, driver or integer lap range are skipped; a
+    missing stint number becomes -1 and a missing tyre age 0.
+    """
+    for stint in stints:
+        tyre = stint.get("compound")
+        dnum = stint.get("driver_number")
+        if not tyre or dnum is None:
+            continue
+        try:
+            start = int(stint.get("lap_start"))
+            end = int(stint.get("lap_end"))
+        except (TypeError, ValueError):
+            continue
+        stint_number = stint.get("stint_number")
+        yield (dnum, -1 if stint_number is None else stint_number, start, end,
+               tyre.upper(), int(stint.get("tyre_age_at_start") or 0))
+
+def join_stint_laps(session, stints, laps, min_stint_laps=None):
+    """Join a session's stints to its lap columns, one row per usable stint lap.
+
+    Stints of at most ``min_stint_laps`` laps, pit-out laps and laps with a
+    missing sector time are dropped. Returns a dict of STINT_LAP_COLUMNS
+    arrays per upper-cased compound.
+    """
+    stints = [stint for stint in usable_stints(stints)
+              if min_stint_laps is None or stint[3] - stint[2] > min_stint_laps]
+    if not stints or not len(laps["lap_number"]):
+        return {}
+
+    drivers, stint_numbers, starts, ends, compounds, ages_at_start = (np.array(column) for column in zip(*stints))
+    lengths = np.maximum(0, ends - starts)
+
+    # Expand every stint into its lap numbers start .. end - 1
+    stint_idx = np.repeat(np.arange(len(starts)), lengths)
+    laps_done = np.arange(len(stint_idx)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    lap_number = starts[stint_idx] + laps_done
+
+    # Gather each stint's lap rows from the dense (driver slot, lap number) index
+    lap_drivers, lap_index = build_lap_index(laps)
+    slot = np.searchsorted(lap_drivers, drivers)[stint_idx]
+    slot = np.minimum(slot, len(lap_drivers) - 1)
+    in_range = (lap_drivers[slot] == drivers[stint_idx]) & (lap_number >= 0) & (lap_number < lap_index.shape[1])
+    row = lap_index[slot, np.where(in_range, lap_number, 0)]
+    found = in_range & (row >= 0)
+    row = np.maximum(row, 0)
+
+    # NaN sector durations propagate, so incomplete laps get a non-finite time
+    lap_time = (laps["duration_sector_1"][row]
+              + laps["duration_sector_2"][row]
+              + laps["duration_sector_3"][row])
+    keep = found & ~laps["is_pit_out_lap"][row] & np.isfinite(lap_time)
+
+    stint_idx = stint_idx[keep]
+    columns = {
+        "lap_time": lap_time[keep],
+        "tyre_age": ages_at_start[stint_idx] + laps_done[keep],
+        "driver": drivers[stint_idx],
+        "session": np.full(len(stint_idx), session, dtype=np.int64),
+        "lap_number": lap_number[keep],
+        "stint_start": starts[stint_idx],
+        "stint_end": ends[stint_idx],
+        "stint_length": lengths[stint_idx],
+        "tyre_age_at_start": ages_at_start[stint_idx],
+        "stint_number": stint_numbers[stint_idx],
+    }
+    compounds = compounds[stint_idx]
+    return {str(compound): {name: column[compounds == compound] for name, column in columns.items()}
+            for compound in np.unique(compounds)}
+
+def concat_columns(parts, names=STINT_LAP_COLUMNS):
+    if not parts:
+        return {name: np.empty(0) for name in names}
+    return {name: np.concatenate([part[name] for part in parts]) for name in names}
+
+def take_rows(columns, index):
+    return {name: column[index] for name, column in columns.items()}
 
-    with open(path, "w") as f:
-        json.dump(data, f)
+# --- Push lap filter ---
+def grouped_median(values, group):
+    """Median of ``values`` within each group id of ``group`` (ids 0..n-1), via one sort."""
+    order = np.lexsort((values, group))
+    counts = np.bincount(group)
+    starts = np.cumsum(counts) - counts
+    sorted_values = values[order]
+    # Mean of the two middle values, which coincide for odd counts
+    return 0.5 * (sorted_values[starts + (counts - 1) // 2] + sorted_values[starts + counts // 2])
 
-    return data
+def push_lap_filter(rows, margin=1.5):
+    """Mask of stint laps to keep: not the first lap of the stint and not a push lap.
+
+    A push lap is more than ``margin`` seconds faster than its stint's median.
+    """
+    group_keys = np.stack([rows["driver"], rows["session"], rows["stint_number"]], axis=1)
+    _, group = np.unique(group_keys, axis=0, return_inverse=True)
+    group = group.reshape(-1)
+    median_time = grouped_median(rows["lap_time"], group)
+    return ((rows["lap_number"] != rows["stint_start"])
+            & (rows["lap_time"] > median_time[group] - margin))
+
+# --- Per-tyre-age aggregation ---
+def aggregate_by_age(ages, values):
+    """Group ``values`` by tyre age with bincount instead of one mask per age.
+
+    Returns (unique_ages, counts, means, variances); variances are population
+    variances around each age's mean.
+    """
+    unique_ages, slot = np.unique(ages, return_inverse=True)
+    slot = slot.reshape(-1)
+    counts = np.bincount(slot, minlength=len(unique_ages))
+    means = np.bincount(slot, weights=values, minlength=len(unique_ages)) / counts
+    variances = np.bincount(slot, weights=(values - means[slot]) ** 2, minlength=len(unique_ages)) / counts
+    return unique_ages, counts, means, variances
+
+# --- Offset exponential fit ---
+FIT_B_BRACKET = (-0.5, 0.5)  # search range for the exponential rate b
+FIT_B_GRID = 200             # even, so b = 0 (where a is undefined) is not a grid point
+FIT_WARM_WINDOW = 0.02       # half-width of the b range scanned around a warm start
+FIT_WARM_GRID = 16
+FIT_EDGE_TOL = 1e-6          # fraction of the bracket width that counts as its edge
+
+class FitResult(NamedTuple):
+    a: float
+    b: float
+    c: float
+    rss: float
+    method: str
+    success: bool
+    message: str
+
+def exp_offset_full(x, a, b, c):
+    return c + a * np.exp(b * x)
+
+def exp_offset_jac(x, a, b, c):
+    e = np.exp(b * x)
+    return np.column_stack([e, a * x * e, np.ones_like(x)])
+
+def varpro_solve(x, y, w, b):
+    """Closed-form (a, c) and weighted RSS of c + a·exp(b·x) for each rate in ``b``.
+
+    With b fixed the model is linear in a and c. The basis expm1(b·u)/b with
+    u = x - mean(x) stays well conditioned as b -> 0, where it tends to u.
+    ``x``, ``y`` and ``w`` may be stacked as (..., N) and ``b`` as (..., G), for
+    instance one rate per series; results are (..., G).
+    """
+    b = np.atleast_1d(np.asarray(b, dtype=float))
+    sw = w.sum(axis=-1, keepdims=True)
+    x0 = (w * x).sum(axis=-1, keepdims=True) / sw
+    u = (x - x0)[..., None, :]
+    zero = b == 0
+    safe_b = np.where(zero, 1.0, b)
+    basis = np.where(zero[..., None], u, np.expm1(safe_b[..., None] * u) / safe_b[..., None])
+
+    w_ = w[..., None, :]
+    basis_mean = (basis * w_).sum(axis=-1) / sw
+    y_mean = (w * y).sum(axis=-1, keepdims=True) / sw
+    basis_c = basis - basis_mean[..., None]
+    y_c = (y - y_mean)[..., None, :]
+    sxx = (basis_c ** 2 * w_).sum(axis=-1)
+    slope = np.divide((basis_c * y_c * w_).sum(axis=-1), sxx, out=np.zeros_like(sxx), where=sxx > 0)
+    rss = ((y_c - slope[..., None] * basis_c) ** 2 * w_).sum(axis=-1)
+
+    # slope·expm1(b·u)/b = (slope/b)·exp(-b·x0)·exp(b·x) - slope/b
+    a = np.where(zero, np.nan, slope / safe_b * np.exp(-b * x0))
+    c = np.where(zero, np.nan, y_mean - slope * basis_mean - slope / safe_b)
+    return a, c, rss
+
+def fit_exp_offset(x, y, sigma=None, bracket=FIT_B_BRACKET, grid_size=FIT_B_GRID, b0=None):
+    """Fit y = c + a·exp(b·x) by variable projection over b.
+
+    (a, c) are solved in closed form for every b, so only a bracketed 1-D
+    search over b remains: a grid scan followed by a bounded Brent refine. If
+    the best b sits on the bracket edge, curve_fit with the analytic Jacobian
+    and b bounded to the bracket is tried from there. When that also ends on
+    the edge the optimum lies outside the bracket, and the in-bracket fit is
+    returned with success=False.
+
+    A warm start ``b0`` (e.g. the previous fit's rate) first scans only a
+    small window around it, and falls back to the full grid if the best b
+    is on the window's edge.
+    """
+    from scipy.optimize import curve_fit, minimize_scalar
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    w = np.ones_like(y) if sigma is None else 1 / np.asarray(sigma, dtype=float) ** 2
+    if len(x) < 3:
+        return FitResult(np.nan, np.nan, np.nan, np.nan, "varpro", False,
+                         f"need at least 3 tyre ages, got {len(x)}")
+
+    grid = None
+    if b0 is not None and np.isfinite(b0):
+        b0 = min(max(b0, bracket[0]), bracket[1])
+        window = np.linspace(max(bracket[0], b0 - FIT_WARM_WINDOW), min(bracket[1], b0 + FIT_WARM_WINDOW),
+                             FIT_WARM_GRID)
+        k = int(np.argmin(varpro_solve(x, y, w, window)[2]))
+        if 0 < k < len(window) - 1 or window[k] in bracket:
+            grid = window
+    if grid is None:
+        grid = np.linspace(*bracket, grid_size)
+        k = int(np.argmin(varpro_solve(x, y, w, grid)[2]))
+    lo, hi = grid[max(k - 1, 0)], grid[min(k + 1, len(grid) - 1)]
+    refined = minimize_scalar(lambda b: varpro_solve(x, y, w, b)[2][0],
+                              bounds=(lo, hi), method="bounded", options={"xatol": 1e-10})
+    b_fit = float(refined.x)
+    a_fit, c_fit, rss = (float(v[0]) for v in varpro_solve(x, y, w, b_fit))
+    fit = FitResult(a_fit, b_fit, c_fit, rss, "varpro", True, "ok")
+
+    if 0 < k < len(grid) - 1 and np.isfinite([a_fit, b_fit, c_fit, rss]).all():
+        return fit
+
+    # Fallback: curve_fit from the varpro estimate, with b held to the bracket
+    message = f"rate b={b_fit:.4g} at the edge of the search bracket {bracket}"
+    lower, upper = (-np.inf, bracket[0], -np.inf), (np.inf, bracket[1], np.inf)
+    try:
+        popt, _ = curve_fit(exp_offset_full, x, y, p0=(a_fit, b_fit, c_fit), jac=exp_offset_jac, bounds=(lower, upper),
+                            sigma=None if sigma is None else np.asarray(sigma, dtype=float), max_nfev=5000)
+    except (RuntimeError, ValueError) as exc:
+        return fit._replace(success=False, message=f"{message}; curve_fit failed: {exc}")
+    rss_lm = float(w @ (y - exp_offset_full(x, *popt)) ** 2)
+    at_edge = np.isclose(popt[1], bracket, rtol=0, atol=FIT_EDGE_TOL * (bracket[1] - bracket[0])).any()
+    if at_edge or not np.isfinite(rss_lm) or (np.isfinite(rss) and rss_lm > rss):
+        return fit._replace(success=False, message=message)
+    return FitResult(*(float(p) for p in popt), rss_lm, "curve_fit", True, "ok")
+
+# --- Batched offset exponential fits ---
+FIT_BATCH_BLOCK = 256  # series per block in the batched grid scan, bounds its memory
+FIT_GOLDEN_ITER = 40   # shrinks a two-grid-step bracket below 1e-10
+INV_PHI = (np.sqrt(5) - 1) / 2
+
+class BatchFitResult(NamedTuple):
+    a: np.ndarray
+    b: np.ndarray
+    c: np.ndarray
+    rss: np.ndarray
+    converged: np.ndarray
+    residuals: np.ndarray  # (n_series, max_len), NaN past each series' end
+
+def fit_exp_offset_batch(series, bracket=FIT_B_BRACKET, max_iter=100, tol=1e-10):
+    """Fit c + a·exp(b·x) to many independent series at once.
+
+    ``series`` holds (x, y) or (x, y, weight) tuples of any lengths. The series
+    are padded into 2D arrays with zero weight and each started from its varpro
+    optimum inside ``bracket`` (grid scan plus a batched golden-section search).
+    All series are then refined together with vectorized Levenberg-Marquardt
+    steps (Marquardt diagonal scaling), with each step's rate clipped to the
+    bracket, until each one converges or ``max_iter`` is reached. A series
+    converges when an accepted step changes the RSS by at most ``tol``
+    relative, or every parameter by at most sqrt(tol) relative. As in
+    fit_exp_offset, a series whose rate ends on the bracket edge is not
+    converged, and series with fewer than 3 points are returned as NaN and
+    not converged.
+    """
+    lengths = np.array([len(s[0]) for s in series], dtype=np.int64)
+    n, width = len(series), int(lengths.max(initial=0))
+    X = np.zeros((n, width))
+    Y = np.zeros((n, width))
+    W = np.zeros((n, width))
+    for i, s in enumerate(series):
+        k = lengths[i]
+        X[i, :k] = s[0]
+        Y[i, :k] = s[1]
+        W[i, :k] = s[2] if len(s) > 2 and s[2] is not None else 1.0
+    valid = lengths >= 3
+
+    def model(p, rows):
+        return p[:, 2:3] + p[:, 0:1] * np.exp(p[:, 1:2] * X[rows])
+
+    def weighted_rss(p, rows):
+        return ((Y[rows] - model(p, rows)) ** 2 * W[rows]).sum(axis=1)
+
+    # --- Starting point: varpro grid scan, then golden section around the best rate ---
+    params = np.full((n, 3), np.nan)
+    grid = np.linspace(*bracket, FIT_B_GRID)
+    rows_valid = np.flatnonzero(valid)
+    for block in np.array_split(rows_valid, max(1, -(-len(rows_valid) // FIT_BATCH_BLOCK))):
+        if not len(block):
+            continue
+        Xb, Yb, Wb = X[block], Y[block], W[block]
+        k = np.argmin(varpro_solve(Xb, Yb, Wb, grid)[2], axis=1)
+        lo, hi = grid[np.maximum(k - 1, 0)], grid[np.minimum(k + 1, len(grid) - 1)]
+
+        def rss_at(b):
+            return varpro_solve(Xb, Yb, Wb, b[:, None])[2][:, 0]
+
+        c_pt, d_pt = hi - INV_PHI * (hi - lo), lo + INV_PHI * (hi - lo)
+        f_c, f_d = rss_at(c_pt), rss_at(d_pt)
+        for _ in range(FIT_GOLDEN_ITER):
+            left = f_c < f_d
+            lo, hi = np.where(left, lo, c_pt), np.where(left, d_pt, hi)
+            new_pt = np.where(left, hi - INV_PHI * (hi - lo), lo + INV_PHI * (hi - lo))
+            f_new = rss_at(new_pt)
+            c_pt, d_pt = np.where(left, new_pt, d_pt), np.where(left, c_pt, new_pt)
+            f_c, f_d = np.where(left, f_new, f_d), np.where(left, f_c, f_new)
+
+        b0 = 0.5 * (lo + hi)
+        a0, c0, _ = varpro_solve(Xb, Yb, Wb, b0[:, None])
+        params[block] = np.column_stack([a0[:, 0], b0, c0[:, 0]])
+
+    # --- Levenberg-Marquardt on all unfinished series together ---
+    rss = np.full(n, np.nan)
+    rss[valid] = weighted_rss(params[valid], valid)
+    lam = np.full(n, 1e-3)
+    converged = np.zeros(n, dtype=bool)
+    active = valid & np.isfinite(rss)
+    for _ in range(max_iter):
+        rows = np.flatnonzero(active)
+        if not len(rows):
+            break
+        p = params[rows]
+        e = np.exp(p[:, 1:2] * X[rows])
+        r = Y[rows] - (p[:, 2:3] + p[:, 0:1] * e)
+        J = np.stack([e, p[:, 0:1] * X[rows] * e, np.ones_like(e)], axis=-1)
+        JtW = (J * W[rows][..., None]).transpose(0, 2, 1)
+        A = JtW @ J
+        g = (JtW @ r[..., None])[..., 0]
+        diag = np.diagonal(A, axis1=1, axis2=2)
+        diag = np.maximum(diag, 1e-12 * diag.max(axis=1, keepdims=True))
+        step = np.linalg.solve(A + lam[rows, None, None] * diag[:, None, :] * np.eye(3),
+                               g[..., None])[..., 0]
+
+        p_new = p + step
+        p_new[:, 1] = np.clip(p_new[:, 1], *bracket)
+        step = p_new - p
+        rss_new = weighted_rss(p_new, rows)
+        improved = np.isfinite(rss_new) & (rss_new < rss[rows])
+        small_step = (np.abs(step) <= np.sqrt(tol) * (np.abs(p) + np.sqrt(tol))).all(axis=1)
+        done = improved & ((rss[rows] - rss_new <= tol * rss[rows]) | small_step)
+
+        better = rows[improved]
+        params[better] = p_new[improved]
+        rss[better] = rss_new[improved]
+        lam[better] /= 10
+        lam[rows[~improved]] *= 10
+
+        # No damping finds a descent direction any more: at a minimum to machine precision
+        done |= ~improved & (lam[rows] > 1e12)
+        converged[rows[done]] = True
+        active[rows[done]] = False
+
+    at_edge = (np.abs(params[:, 1:2] - np.array(bracket)) <= FIT_EDGE_TOL * (bracket[1] - bracket[0])).any(axis=1)
+    converged &= np.isfinite(params).all(axis=1) & ~at_edge
+    padding = np.arange(width) >= lengths[:, None]
+    residuals = np.where(padding, np.nan, Y - model(params, slice(None)))
+    return BatchFitResult(params[:, 0], params[:, 1], params[:, 2], rss, converged, residuals)
+
+# --- SQLite lap store ---
+# Optional backend (LAP_STORE = "sqlite"): sessions, stints and laps in one
+# indexed database, so a session's stint laps come from a single query.
+LAP_STORE_PATH = os.path.join(CACHE_DIR, "laps.sqlite")
+LAP_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_key INTEGER PRIMARY KEY,
+    meeting_key INTEGER,
+    country_name TEXT,
+    circuit_short_name TEXT,
+    session_name TEXT,
+    session_type TEXT,
+    year INTEGER,
+    date_start TEXT,
+    date_end TEXT
+);
+CREATE TABLE IF NOT EXISTS stints (
+    session_key INTEGER NOT NULL,
+    driver_number INTEGER NOT NULL,
+    stint_number INTEGER NOT NULL,
+    lap_start INTEGER NOT NULL,
+    lap_end INTEGER NOT NULL,
+    compound TEXT NOT NULL,
+    tyre_age_at_start INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stints_by_compound ON stints (session_key, compound);
+CREATE TABLE IF NOT EXISTS laps (
+    session_key INTEGER NOT NULL,
+    driver_number INTEGER NOT NULL,
+    lap_number INTEGER NOT NULL,
+    duration_sector_1 REAL,
+    duration_sector_2 REAL,
+    duration_sector_3 REAL,
+    lap_duration REAL,
+    is_pit_out_lap INTEGER NOT NULL,
+    i1_speed REAL,
+    i2_speed REAL,
+    st_speed REAL,
+    PRIMARY KEY (session_key, driver_number, lap_number)
+);
+CREATE TABLE IF NOT EXISTS ingested_sessions (
+    session_key INTEGER PRIMARY KEY
+);
+"""
+SESSION_FIELDS = ["session_key", "meeting_key", "country_name", "circuit_short_name",
+                  "session_name", "session_type", "year", "date_start", "date_end"]
+
+_lap_store = None
+
+def lap_store():
+    global _lap_store
+    if _lap_store is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        conn = sqlite3.connect(LAP_STORE_PATH, timeout=60)
+        # WAL lets batch workers read while another process ingests
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(LAP_STORE_SCHEMA)
+        _lap_store = conn
+    return _lap_store
+
+def store_sessions(sessions):
+    with lap_store() as conn:
+        conn.executemany(f"INSERT OR REPLACE INTO sessions VALUES ({', '.join('?' * len(SESSION_FIELDS))})",
+                         [[s.get(name) for name in SESSION_FIELDS] for s in sessions])
+
+def ingest_session(session):
+    """Copy a session's cached stints and laps into the store, once."""
+    conn = lap_store()
+    if conn.execute("SELECT 1 FROM ingested_sessions WHERE session_key = ?", (session,)).fetchone():
+        return
+
+    stints = [(session, *stint) for stint in
+              usable_stints(fetch_and_cache(f"{OPENF1_API}/stints?session_key={session}", f"stints_{session}.json"))]
+
+    laps = load_laps(session)
+    # NaN floats are stored as NULL
+    lap_rows = zip(*([[session] * len(laps["lap_number"])]
+                     + [laps[name].tolist() for name in LAP_COLUMNS]))
+
+    with conn:
+        conn.execute("DELETE FROM stints WHERE session_key = ?", (session,))
+        conn.execute("DELETE FROM laps WHERE session_key = ?", (session,))
+        conn.executemany("INSERT INTO stints VALUES (?, ?, ?, ?, ?, ?, ?)", stints)
+        conn.executemany(f"INSERT OR REPLACE INTO laps (session_key, {', '.join(LAP_COLUMNS)}) "
+                         f"VALUES ({', '.join('?' * (len(LAP_COLUMNS) + 1))})", lap_rows)
+        conn.execute("INSERT INTO ingested_sessions VALUES (?)", (session,))
+
+STORE_STINT_LAPS_QUERY = """
+SELECT st.compound,
+       l.duration_sector_1 + l.duration_sector_2 + l.duration_sector_3 AS lap_time,
+       st.tyre_age_at_start + (l.lap_number - st.lap_start) AS tyre_age,
+       st.driver_number, l.lap_number, st.lap_start, st.lap_end,
+       st.lap_end - st.lap_start AS stint_length, st.tyre_age_at_start, st.stint_number
+FROM stints st
+JOIN laps l
+  ON l.session_key = st.session_key
+ AND l.driver_number = st.driver_number
+ AND l.lap_number >= st.lap_start AND l.lap_number < st.lap_end
+WHERE st.session_key = ?
+  AND st.lap_end - st.lap_start > ?
+  AND NOT l.is_pit_out_lap
+  AND lap_time IS NOT NULL
+ORDER BY st.rowid, l.lap_number
+"""
+
+def store_stint_laps(session, min_stint_laps):
+    """Same result as join_stint_laps, read from the store with one indexed query."""
+    ingest_session(session)
+    rows = lap_store().execute(STORE_STINT_LAPS_QUERY, (session, min_stint_laps)).fetchall()
+    if not rows:
+        return {}
+
+    compounds, lap_time, *ints = zip(*rows)
+    ints = np.array(ints, dtype=np.int64)
+    columns = {"lap_time": np.array(lap_time, dtype=np.float64)}
+    for name, values in zip(["tyre_age", "driver", "lap_number", "stint_start", "stint_end",
+                             "stint_length", "tyre_age_at_start", "stint_number"], ints):
+        columns[name] = values
+    columns["session"] = np.full(len(rows), session, dtype=np.int64)
+    columns = {name: columns[name] for name in STINT_LAP_COLUMNS}
+
+    compounds = np.array(compounds)
+    return {str(compound): take_rows(columns, compounds == compound) for compound in np.unique(compounds)}
+
+# --- Session catalog ---
+# Every session OpenF1 lists, fetched a whole year per request, so picking an
+# event's sessions is a local lookup instead of a query per country and year.
+CATALOG_PATH = os.path.join(CACHE_DIR, "session_catalog.json")
+CATALOG_REFRESH_SECONDS = 3600  # re-query a year that has not finished at most this often
+CATALOG_INDEXES = ["year", "country_name", "circuit_short_name", "session_name", "session_type", "date"]
+
+class SessionCatalog:
+    """Session records by session_key, with a lookup index per field in CATALOG_INDEXES.
+
+    ``years`` maps each bulk-fetched year (as a string) to the time it was fetched.
+    """
+
+    def __init__(self, sessions=(), years=None):
+        self.sessions = {}
+        self.years = dict(years or {})
+        self._index = {field: defaultdict(set) for field in CATALOG_INDEXES}
+        self.add(sessions)
+
+    @staticmethod
+    def index_values(session):
+        for field in CATALOG_INDEXES:
+            if field == "date":
+                value = (session.get("date_start") or "")[:10] or None
+            else:
+                value = session.get(field)
+            if value is not None:
+                yield field, value
+
+    def add(self, sessions):
+        """Insert new records and replace changed ones; returns how many there were."""
+        changed = 0
+        for session in sessions:
+            key = session.get("session_key")
+            old = self.sessions.get(key)
+            if key is None or old == session:
+                continue
+            if old is not None:
+                for field, value in self.index_values(old):
+                    self._index[field][value].discard(key)
+            self.sessions[key] = session
+            for field, value in self.index_values(session):
+                self._index[field][value].add(key)
+            changed += 1
+        return changed
+
+    def find(self, **criteria):
+        """Records matching every ``field=value`` criterion, ordered by start time.
+
+        ``date`` matches the YYYY-MM-DD a session starts on.
+        """
+        keys = set(self.sessions)
+        for field, value in criteria.items():
+            if field not in self._index:
+                raise TypeError(f"sessions are not indexed by {field!r}")
+            keys &= self._index[field].get(value, set())
+        return sorted((self.sessions[key] for key in keys),
+                      key=lambda s: (s.get("date_start") or "", s["session_key"]))
+
+    def needs_refresh(self, year, now=None, max_age=CATALOG_REFRESH_SECONDS):
+        """Whether ``year`` was never fetched, or may have changed since it was.
+
+        A year fetched after it ended is final and is never queried again.
+        """
+        fetched_at = self.years.get(str(year))
+        if fetched_at is None:
+            return True
+        now = time.time() if now is None else now
+        year_end = datetime(year + 1, 1, 1, tzinfo=timezone.utc).timestamp()
+        return fetched_at < year_end and now - fetched_at > max_age
+
+_catalog = None
+
+def session_catalog():
+    """The catalog, read from CATALOG_PATH once per process.
+
+    A new catalog is seeded from the per-event sessions files already in the
+    cache, so existing caches keep working without the network.
+    """
+    global _catalog
+    if _catalog is None:
+        try:
+            with open(CATALOG_PATH) as f:
+                data = json.load(f)
+            _catalog = SessionCatalog(data["sessions"], data["years"])
+        except FileNotFoundError:
+            _catalog = SessionCatalog()
+            for fname in sorted(os.listdir(CACHE_DIR)) if os.path.isdir(CACHE_DIR) else []:
+                if re.fullmatch(r"sessions_.+\.json(\.gz|\.zst)?", fname):
+                    with open_cached(os.path.join(CACHE_DIR, fname)) as f:
+                        _catalog.add(json.load(f))
+            if _catalog.sessions:
+                save_catalog(_catalog)
+    return _catalog
+
+def save_catalog(catalog):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{CATALOG_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"years": catalog.years, "sessions": list(catalog.sessions.values())}, f)
+    os.replace(tmp_path, CATALOG_PATH)
+
+def refresh_catalog(years, force=False, concurrency=None):
+    """Bulk-fetch the sessions of each year in ``years`` that needs it; returns the years fetched."""
+    catalog = session_catalog()
+    now = time.time()
+    stale = [year for year in dict.fromkeys(years) if force or catalog.needs_refresh(year, now)]
+    if not stale:
+        return []
+    with ThreadPoolExecutor(max_workers=concurrency or FETCH_CONCURRENCY) as pool:
+        fetched = list(pool.map(lambda year: fetch_json(f"{OPENF1_API}/sessions?year={year}"), stale))
+    for year, sessions in zip(stale, fetched):
+        catalog.add(sessions)
+        catalog.years[str(year)] = now
+    save_catalog(catalog)
+    return stale
 
 # --- User parameters ---
 COUNTRY = "Spain"
@@ -40,219 +1001,1071 @@ YEAR = 2024
 SESSION_TYPE = "Practice"
 COMPOUNDS = ["SOFT", "MEDIUM", "HARD"] 
 SECONDS_SAVED_PER_LAP_FUEL = 0.045
+WEIGHT_FIT_BY_COUNT = False  # weight each tyre-age mean by its number of laps
+MIN_STINT_LAPS = 5           # only stints spanning more than this many laps are used
+PUSH_LAP_MARGIN = 1.5        # drop laps this many seconds faster than their stint median
+THRESHOLD = 1.03             # sequential filter: remove if > 1.03 × last accepted lap
+MIN_TYRE_AGE = 2             # tyre ages below this are left out of the fit
+LAP_STORE = "files"          # "files" (JSON + npz per session) or "sqlite" (cache/laps.sqlite)
 
-# --- Get sessions ---
-sessions_url = f"https://api.openf1.org/v1/sessions?country_name={COUNTRY}&session_type={SESSION_TYPE}&year={YEAR}"
-sessions = fetch_and_cache(sessions_url, f"sessions_{COUNTRY}_{SESSION_TYPE}_{YEAR}.json")
-practice_session_keys = [s["session_key"] for s in sessions[:3]]
-# print("Practice sessions:", practice_session_keys)
+# --- Session ingest ---
+def load_sessions(country, year, session_type):
+    """Session keys of an event's first three sessions of ``session_type`` (e.g. FP1-FP3).
 
-# --- Store data for combined plot ---
-combined_fits = []
+    Looked up in the session catalog. The year is fetched when the event is
+    missing from it, or when the event is incomplete and the year's bulk fetch
+    may be stale. Events seeded from per-event sessions files are taken as they
+    are, since those files were the complete answer when they were cached.
+    """
+    catalog = session_catalog()
+    criteria = dict(year=year, country_name=country, session_type=session_type)
+    sessions = catalog.find(**criteria)
+    bulk_fetched = str(year) in catalog.years
+    if catalog.needs_refresh(year) and (not sessions or len(sessions) < 3 and bulk_fetched):
+        try:
+            refresh_catalog([year])
+        except Exception as exc:
+            if not sessions:
+                raise
+            warnings.warn(f"could not refresh the {year} session catalog: {exc}")
+        sessions = catalog.find(**criteria)
+    if LAP_STORE == "sqlite":
+        store_sessions(sessions)
+    return [s["session_key"] for s in sessions[:3]]
 
-# --- Loop over compounds ---
-for COMPOUND in COMPOUNDS:
-    rows = []
-    for session in practice_session_keys:
-        stints = fetch_and_cache(f"https://api.openf1.org/v1/stints?session_key={session}", f"stints_{session}.json")
-        laps = fetch_and_cache(f"https://api.openf1.org/v1/laps?session_key={session}", f"laps_{session}.json")
-        stints = [stint for stint in stints if (stint["lap_end"] - stint["lap_start"]) > 5]
+# Joined stint-lap columns per (session, min_stint_laps), kept for the lifetime of the process
+_stint_laps_by_session = {}
 
-        # Group laps by driver
-        laps_by_driver = defaultdict(dict)
-        for lap in laps:
-            dnum = lap.get("driver_number")
-            ln = lap.get("lap_number")
-            if dnum is not None and ln is not None:
-                laps_by_driver[dnum][ln] = lap
-
-        # Iterate stints
-        for stint in stints:
-            tyre = stint.get("compound")
-            if not tyre or tyre.upper() != COMPOUND.upper():
-                continue
-            dnum = stint.get("driver_number")
-            try:
-                start = int(stint.get("lap_start"))
-                end = int(stint.get("lap_end"))
-            except (TypeError, ValueError):
+def session_stint_laps(session, min_stint_laps=MIN_STINT_LAPS):
+    key = (session, min_stint_laps)
+    if key not in _stint_laps_by_session and LAP_STORE == "sqlite":
+        _stint_laps_by_session[key] = store_stint_laps(session, min_stint_laps)
+    elif key not in _stint_laps_by_session:
+        stints = fetch_and_cache(f"{OPENF1_API}/stints?session_key={session}", f"stints_{session}.json")
+        laps = load_laps(session)
+        _stint_laps_by_session[key] = join_stint_laps(session, stints, laps, min_stint_laps)
+    return _stint_laps_by_session[key]
+
+def build_stint_laps(session_keys, min_stint_laps=MIN_STINT_LAPS, concurrency=None):
+    """Joined stint-lap columns of all ``session_keys``, one column dict per compound.
+
+    Missing files are downloaded in background threads, and each session is
+    parsed and joined as soon as its files are in, while later sessions are
+    still in flight. Each session is parsed once per process; later calls
+    with the same session reuse it from memory.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency or FETCH_CONCURRENCY) as pool:
+        downloads = {}
+        for session in session_keys:
+            if (session, min_stint_laps) in _stint_laps_by_session:
                 continue
-            stint_length = max(0, end - start)
-            tyre_age_start = int(stint.get("tyre_age_at_start", 0))
+            stints_target, laps_target = session_targets(session)
+            if not cached_path(stints_target[1]):
+                downloads[pool.submit(download_to_cache, *stints_target)] = session
+            if not cached_path(laps_target[1]):
+                # Streams the laps straight into their columnar copy
+                downloads[pool.submit(load_laps, session)] = session
+        pending = Counter(downloads.values())
 
-            driver_laps = laps_by_driver.get(dnum, {})
-            for ln in range(start, end):
-                lap = driver_laps.get(ln)
-                if not lap or lap.get("is_pit_out_lap"):
-                    continue
-                try:
-                    lap_time = (float(lap["duration_sector_1"])
-                              + float(lap["duration_sector_2"])
-                              + float(lap["duration_sector_3"]))
-                except (TypeError, KeyError, ValueError):
-                    continue
+        # Sessions already on disk first, then the rest in download order
+        for session in session_keys:
+            if session not in pending:
+                session_stint_laps(session, min_stint_laps)
+        for future in as_completed(downloads):
+            future.result()
+            session = downloads[future]
+            pending[session] -= 1
+            if not pending[session]:
+                session_stint_laps(session, min_stint_laps)
+
+    parts_by_compound = defaultdict(list)
+    for session in session_keys:
+        for compound, columns in session_stint_laps(session, min_stint_laps).items():
+            parts_by_compound[compound].append(columns)
+    return {compound: concat_columns(parts) for compound, parts in parts_by_compound.items()}
+
+# --- Incremental sync ---
+SESSION_SETTLE_SECONDS = 3600  # OpenF1 data can still change this long after a session ends
+LIVE_REFRESH_SECONDS = 60      # re-download a live session's files at most this often
+
+def parse_time(stamp):
+    return datetime.fromisoformat(stamp).timestamp()
+
+def sync_targets(session, log, now):
+    """The (url, fname) pairs of catalog record ``session`` that are missing or stale.
+
+    Files fetched after the session settled are final. Files with no fetch
+    record (cached before the log existed) are dated by their mtime.
+    """
+    if not session.get("date_start") or parse_time(session["date_start"]) > now:
+        return []
+    settled = parse_time(session["date_end"]) + SESSION_SETTLE_SECONDS if session.get("date_end") else np.inf
+    targets = []
+    for url, fname in session_targets(session["session_key"]):
+        path = cached_path(fname)
+        if path is None:
+            targets.append((url, fname))
+            continue
+        fetched_at = log.get(fname) or os.path.getmtime(path)
+        if fetched_at < settled and now - fetched_at >= LIVE_REFRESH_SECONDS:
+            targets.append((url, fname))
+    return targets
+
+def sync_cache(years, session_type=SESSION_TYPE, concurrency=None, now=None):
+    """Bring the cache up to date with the catalog for ``session_type`` sessions in ``years``.
+
+    Refreshes the catalog where it may be stale, then concurrently downloads
+    only the missing files and those of sessions still live when they were
+    last fetched; a file that fails to download is skipped with a warning.
+    Returns the (url, fname) pairs downloaded.
+    """
+    refresh_catalog(years)
+    catalog = session_catalog()
+    now = time.time() if now is None else now
+    log = read_fetch_log()
+    targets = []
+    refreshed = set()
+    for year in years:
+        for session in catalog.find(year=year, session_type=session_type):
+            stale = sync_targets(session, log, now)
+            targets += stale
+            if any(cached_path(fname) for _, fname in stale):
+                refreshed.add(session["session_key"])
+    if not targets:
+        return []
+
+    def download(target):
+        try:
+            return download_to_cache(*target, refresh=True) and target
+        except Exception as exc:
+            # Left unrecorded, so the next sync tries it again
+            warnings.warn(f"could not download {target[1]}: {exc}")
 
-                tyre_age = tyre_age_start + (ln - start)
-                rows.append({
-                    "lap_time": lap_time,
-                    "tyre_age": tyre_age,
-                    "driver": dnum,
-                    "session": session,
-                    "lap_number": ln,
-                    "stint_start": start,
-                    "stint_end": end,
-                    "stint_length": stint_length,
-                    "tyre_age_at_start": tyre_age_start,
-                    "stint_number": stint.get("stint_number")
-                })
-
-    # --- Push lap filter + drop first lap of each stint ---
-    rows_filtered = []
-    groups = defaultdict(list)
-    for r in rows:
-        key = (r["driver"], r["session"], r["stint_number"])
-        groups[key].append(r)
-
-    for group in groups.values():
-        lap_times = np.array([r["lap_time"] for r in group])
-        median_time = np.median(lap_times)
-        for r in group:
-            if r["lap_number"] == r["stint_start"]:
-                continue  # drop first lap of stint
-            if r["lap_time"] > median_time - 1.5:  # drop push laps
-                rows_filtered.append(r)
-
-    rows = rows_filtered
-
-    # --- Fuel correction ---
-    detailed = []
-    for r in rows:
-        ln = r["lap_number"]
-        start = r["stint_start"]
-        laps_done = ln - start
-        stint_len = r["stint_length"]
-        start_fuel_laps = stint_len + 2
-        remaining_fuel_laps = max(0, start_fuel_laps - laps_done)
-
-        penalty_sec = remaining_fuel_laps * SECONDS_SAVED_PER_LAP_FUEL
-        fuel_corrected_time_zero = r["lap_time"] - penalty_sec
-
-        newrow = r.copy()
-        newrow.update({
-            "fuel_corrected_time_zero": fuel_corrected_time_zero,
-        })
-        detailed.append(newrow)
-
-    # --- Sequential anomaly filter ---
-    rows_filtered_seq = []
+    with ThreadPoolExecutor(max_workers=concurrency or FETCH_CONCURRENCY) as pool:
+        fetched = [target for target in pool.map(download, targets) if target]
+
+    # Forget what was parsed or ingested from the replaced files
+    for key in [key for key in _stint_laps_by_session if key[0] in refreshed]:
+        del _stint_laps_by_session[key]
+    if refreshed and os.path.exists(LAP_STORE_PATH):
+        with lap_store() as conn:
+            conn.executemany("DELETE FROM ingested_sessions WHERE session_key = ?",
+                             [(session,) for session in refreshed])
+    return fetched
+
+# --- Per-compound pipeline stages ---
+def filter_laps(rows, push_lap_margin=PUSH_LAP_MARGIN):
+    """Drop the first lap of each stint and push laps."""
+    return take_rows(rows, push_lap_filter(rows, push_lap_margin))
+
+def fuel_correct(rows, seconds_saved_per_lap=SECONDS_SAVED_PER_LAP_FUEL):
+    """Add a ``fuel_corrected_time_zero`` column: lap times corrected to zero fuel."""
+    laps_done = rows["lap_number"] - rows["stint_start"]
+    start_fuel_laps = rows["stint_length"] + 2
+    remaining_fuel_laps = np.maximum(0, start_fuel_laps - laps_done)
+
+    penalty_sec = remaining_fuel_laps * seconds_saved_per_lap
+    return {**rows, "fuel_corrected_time_zero": rows["lap_time"] - penalty_sec}
+
+def drop_anomalies(rows, threshold=THRESHOLD):
+    """Sequential anomaly filter: walking in tyre-age order, drop laps slower than
+    ``threshold`` × the last accepted fuel-corrected lap. Rows come back in that order."""
     last_mean = None
-    THRESHOLD = 1.03  # Remove if > 1.03 × last accepted lap
-
-    sorted_indices = np.argsort([r["tyre_age"] for r in detailed])
-    for idx in sorted_indices:
-        r = detailed[idx]
-        lap_time = r["fuel_corrected_time_zero"]
-        if last_mean is None or lap_time <= THRESHOLD * last_mean:
-            rows_filtered_seq.append(r)
+
+    sorted_indices = np.argsort(rows["tyre_age"])
+    sorted_times = rows["fuel_corrected_time_zero"][sorted_indices]
+    accepted = np.zeros(len(sorted_indices), dtype=bool)
+    for i, lap_time in enumerate(sorted_times.tolist()):
+        if last_mean is None or lap_time <= threshold * last_mean:
+            accepted[i] = True
             last_mean = lap_time
 
-    detailed = rows_filtered_seq
+    return take_rows(rows, sorted_indices[accepted])
 
-    # --- Compute mean per tyre age ---
-    ages_clean = np.array([r["tyre_age"] for r in detailed])
-    fuel_zero_clean = np.array([r["fuel_corrected_time_zero"] for r in detailed])
-    unique_ages = np.array(sorted(set(ages_clean)))
-    mean_times_fuel_zero = np.array([fuel_zero_clean[ages_clean == a].mean() for a in unique_ages])
+def fit_curve(unique_ages, lap_counts, mean_times, min_tyre_age=MIN_TYRE_AGE,
+              weight_by_count=WEIGHT_FIT_BY_COUNT, **fit_options):
+    """Fit the offset exponential to per-age means from aggregate_by_age.
 
+    Returns (fit, x, y) where x/y are the tyre ages and mean lap times fitted.
+    """
     # --- Mask very low tyre ages ---
-    mask = unique_ages >= 2
+    mask = unique_ages >= min_tyre_age
     x = unique_ages[mask]
-    y = mean_times_fuel_zero[mask]
-
-    # --- Avoid log(0) for exponential fits ---
-    y_safe = np.clip(y, 1e-6, None)
-    log_y = np.log(y_safe)
-    X = x.reshape(-1, 1)
-
-    # # --- 1. RANSAC exponential fit ---
-    # ransac = RANSACRegressor(estimator=LinearRegression(), min_samples=0.5,
-    #                          residual_threshold=0.05, random_state=42)
-    # ransac.fit(X, log_y)
-    # b_r = ransac.estimator_.coef_[0]
-    # a_r = np.exp(ransac.estimator_.intercept_)
-    x_plot = np.linspace(x.min(), x.max(), 200)
-    # y_fit_r = a_r * np.exp(b_r * x_plot)
+    y = mean_times[mask]
+    # Standard error of a mean shrinks with 1/sqrt(count)
+    sigma = 1 / np.sqrt(lap_counts[mask]) if weight_by_count else None
 
-    # # --- 2. Huber exponential fit ---
-    # huber = HuberRegressor()
-    # huber.fit(X, log_y)
-    # b_h = huber.coef_[0]
-    # a_h = np.exp(huber.intercept_)
-    # y_fit_h = a_h * np.exp(b_h * x_plot)
+    # --- Offset exponential fit ---
+    return fit_exp_offset(x, y, sigma=sigma, **fit_options), x, y
 
-    # --- 3. Offset exponential fit ---
-    def exp_offset_full(x, a, b, c):
-        return c + a * np.exp(b * x)
+def compound_curve(rows, compound, params=None):
+    """Run filter -> fuel correction -> anomaly filter -> aggregation -> fit on one compound."""
+    params = pipeline_params() if params is None else params
+    rows = filter_laps(rows, params["push_lap_margin"])
+    rows = fuel_correct(rows, params["seconds_saved_per_lap_fuel"])
+    rows = drop_anomalies(rows, params["threshold"])
+    unique_ages, lap_counts, mean_times, _ = aggregate_by_age(rows["tyre_age"], rows["fuel_corrected_time_zero"])
 
-    p0 = (1, 0.05, np.min(y))
-    try:
-        popt, _ = curve_fit(exp_offset_full, x, y, p0=p0, maxfev=5000)
-        a_fit, b_fit, c_fit = popt
-    except RuntimeError:
-        a_fit, b_fit, c_fit = np.nan, np.nan, np.nan
+    fit, x, y = fit_curve(unique_ages, lap_counts, mean_times, params["min_tyre_age"], params["weight_fit_by_count"],
+                          bracket=tuple(params["fit_b_bracket"]), grid_size=params["fit_b_grid"])
+    if not fit.success:
+        warnings.warn(f"{compound} fit did not converge: {fit.message}")
+    return fit, x, y
+
+# --- Fit result cache ---
+# Bump when a pipeline change alters results without changing any parameter
+PIPELINE_VERSION = 2
+RESULTS_DIR = os.path.join(CACHE_DIR, "results")
+
+def pipeline_params(**overrides):
+    """Every parameter that affects a fit: the user parameters with ``overrides`` applied."""
+    params = {
+        "version": PIPELINE_VERSION,
+        "seconds_saved_per_lap_fuel": SECONDS_SAVED_PER_LAP_FUEL,
+        "weight_fit_by_count": WEIGHT_FIT_BY_COUNT,
+        "min_stint_laps": MIN_STINT_LAPS,
+        "push_lap_margin": PUSH_LAP_MARGIN,
+        "threshold": THRESHOLD,
+        "min_tyre_age": MIN_TYRE_AGE,
+        "fit_b_bracket": list(FIT_B_BRACKET),
+        "fit_b_grid": FIT_B_GRID,
+    }
+    unknown = set(overrides) - set(params)
+    if unknown:
+        raise TypeError(f"unknown pipeline parameters: {', '.join(sorted(unknown))}")
+    params.update(overrides)
+    return params
+
+def inputs_digest(session_keys):
+    """Content hash of every cached stints/laps file behind ``session_keys``.
+
+    Returns None while any of them is still missing from the cache.
+    """
+    digest = hashlib.sha256()
+    for session in session_keys:
+        for _, fname in session_targets(session):
+            path = cached_path(fname)
+            if path is None:
+                return None
+            digest.update(fname.encode())
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()
+
+def curve_cache_path(digest, compound, params):
+    key = json.dumps({"inputs": digest, "compound": compound.upper(), **params}, sort_keys=True)
+    return os.path.join(RESULTS_DIR, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+def curve_to_entry(fit, x, y):
+    return {"fit": fit._asdict(), "x": np.asarray(x).tolist(), "y": np.asarray(y).tolist()}
+
+def entry_to_curve(entry):
+    return FitResult(**entry["fit"]), np.array(entry["x"]), np.array(entry["y"])
+
+def load_cached_curve(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return entry_to_curve(json.load(f))
+
+def store_cached_curve(path, fit, x, y):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    entry = curve_to_entry(fit, x, y)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, path)
+
+def cached_curves(digest, compounds, params):
+    """{compound: (fit, x, y)} of the ``compounds`` already in cache/results."""
+    cached = {}
+    if digest is not None:
+        for compound in compounds:
+            hit = load_cached_curve(curve_cache_path(digest, compound, params))
+            if hit is not None:
+                cached[compound] = hit
+    return cached
+
+def compute_curves(country, year, session_type, compounds, **overrides):
+    """Fit every compound of an event; returns a list of (compound, fit, x, y).
+
+    Keyword arguments override pipeline parameters (see pipeline_params).
+    Fits are served from cache/results when the input files and parameters
+    are unchanged, without loading any laps. Raises LookupError when the
+    event has no sessions.
+    """
+    params = pipeline_params(**overrides)
+    session_keys = load_sessions(country, year, session_type)
+    if not session_keys:
+        raise LookupError(f"no {session_type} sessions found for {country} {year}")
+
+    # None while any input is still missing, and nothing can be cached then
+    digest = inputs_digest(session_keys)
+    cached = cached_curves(digest, compounds, params)
+
+    # --- Download and ingest each session once, partitioned by compound ---
+    stint_laps = {}
+    if any(compound not in cached for compound in compounds):
+        stint_laps = build_stint_laps(session_keys, params["min_stint_laps"])
+        digest = digest or inputs_digest(session_keys)
+
+    curves = []
+    for compound in compounds:
+        if compound in cached:
+            fit, x, y = cached[compound]
+        else:
+            rows = stint_laps.get(compound.upper()) or concat_columns([])
+            fit, x, y = compound_curve(rows, compound, params)
+            if digest is not None:
+                store_cached_curve(curve_cache_path(digest, compound, params), fit, x, y)
+        curves.append((compound, fit, x, y))
+    return curves
+
+# --- Fuel-corrected lap store ---
+# Per-session (tyre_age, fuel-corrected time) of the laps that survive the
+# push lap filter, in join order, so pooled curves over any set of sessions
+# read a few columns per session instead of re-parsing and re-joining laps.
+# The sequential anomaly filter walks all laps in tyre-age order and cannot be
+# merged per session, so it runs over the concatenated rows at pool time,
+# exactly as compute_curves runs it over an event.
+STATS_STORE_PATH = os.path.join(CACHE_DIR, "lap_stats.sqlite")
+STATS_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lap_sources (
+    session_key INTEGER NOT NULL,
+    params TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    PRIMARY KEY (session_key, params)
+);
+CREATE TABLE IF NOT EXISTS corrected_laps (
+    session_key INTEGER NOT NULL,
+    params TEXT NOT NULL,
+    compound TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    tyre_age INTEGER NOT NULL,
+    time REAL NOT NULL,
+    PRIMARY KEY (params, compound, session_key, seq)
+);
+"""
+# The pipeline parameters applied before the laps are stored
+STATS_PARAMS = ["version", "seconds_saved_per_lap_fuel", "min_stint_laps", "push_lap_margin"]
+
+_stats_store = None
 
-    y_fit_offset = exp_offset_full(x_plot, a_fit, b_fit, c_fit)
+def stats_store():
+    global _stats_store
+    if _stats_store is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        conn = sqlite3.connect(STATS_STORE_PATH, timeout=60)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(STATS_STORE_SCHEMA)
+        _stats_store = conn
+    return _stats_store
+
+def stats_params_key(params):
+    key = json.dumps({name: params[name] for name in STATS_PARAMS}, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+def inputs_stamp(session):
+    """Size and mtime of a session's cached files; None while any is missing."""
+    stamp = []
+    for _, fname in session_targets(session):
+        path = cached_path(fname)
+        if path is None:
+            return None
+        st = os.stat(path)
+        stamp.append([os.path.basename(path), st.st_size, st.st_mtime_ns])
+    return json.dumps(stamp)
+
+def store_session_laps(session, params):
+    """Push-lap filter and fuel-correct a session's laps and record them per compound."""
+    key = stats_params_key(params)
+    rows = []
+    for compound, columns in session_stint_laps(session, params["min_stint_laps"]).items():
+        columns = fuel_correct(filter_laps(columns, params["push_lap_margin"]), params["seconds_saved_per_lap_fuel"])
+        rows += [(session, key, compound, seq, age, time) for seq, (age, time) in
+                 enumerate(zip(columns["tyre_age"].tolist(), columns["fuel_corrected_time_zero"].tolist()))]
+
+    with stats_store() as conn:
+        conn.execute("DELETE FROM corrected_laps WHERE session_key = ? AND params = ?", (session, key))
+        conn.executemany("INSERT INTO corrected_laps VALUES (?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("INSERT OR REPLACE INTO lap_sources VALUES (?, ?, ?)",
+                     (session, key, inputs_stamp(session)))
+
+def ensure_session_laps(session_keys, params):
+    """Store the laps of every session whose inputs changed since they were stored."""
+    key = stats_params_key(params)
+    stored = dict(stats_store().execute("SELECT session_key, inputs FROM lap_sources WHERE params = ?", (key,)))
+    stale = []
+    for session in session_keys:
+        stamp = inputs_stamp(session)
+        if stamp is None or stored.get(session) != stamp:
+            stale.append(session)
+    if stale:
+        build_stint_laps(stale, params["min_stint_laps"])
+        for session in stale:
+            store_session_laps(session, params)
+
+def pooled_stats(session_keys, compound, **overrides):
+    """Merged (tyre_ages, counts, means, variances) of ``compound`` over ``session_keys``.
+
+    The stored laps are concatenated in ``session_keys`` order before the
+    anomaly filter, so an event's sessions in load_sessions order give the
+    same statistics as compute_curves.
+    """
+    params = pipeline_params(**overrides)
+    session_keys = list(dict.fromkeys(session_keys))
+    ensure_session_laps(session_keys, params)
+    rows = stats_store().execute(
+        f"SELECT session_key, seq, tyre_age, time FROM corrected_laps "
+        f"WHERE params = ? AND compound = ? AND session_key IN ({', '.join('?' * len(session_keys))})",
+        (stats_params_key(params), compound.upper(), *session_keys)).fetchall()
+    if not rows:
+        empty = np.empty(0)
+        return empty.astype(np.int64), empty.astype(np.int64), empty, empty
+    position = {session: i for i, session in enumerate(session_keys)}
+    rows.sort(key=lambda row: (position[row[0]], row[1]))
+    _, _, ages, times = zip(*rows)
+    rows = drop_anomalies({"tyre_age": np.array(ages, dtype=np.int64), "fuel_corrected_time_zero": np.array(times)},
+                          params["threshold"])
+    return aggregate_by_age(rows["tyre_age"], rows["fuel_corrected_time_zero"])
+
+def pooled_curves(session_keys, compounds, **overrides):
+    """Fit every compound over the union of ``session_keys`` from the fuel-corrected lap store.
+
+    Returns a list of (compound, fit, x, y) like compute_curves.
+    """
+    params = pipeline_params(**overrides)
+    curves = []
+    for compound in compounds:
+        ages, counts, means, _ = pooled_stats(session_keys, compound, **overrides)
+        fit, x, y = fit_curve(ages, counts, means, params["min_tyre_age"], params["weight_fit_by_count"],
+                              bracket=tuple(params["fit_b_bracket"]), grid_size=params["fit_b_grid"])
+        if not fit.success:
+            warnings.warn(f"pooled {compound} fit did not converge: {fit.message}")
+        curves.append((compound, fit, x, y))
+    return curves
+
+# --- Plots ---
+# Hash of the inputs each PNG was last rendered from (plus its mtime), so unchanged plots are skipped
+PLOT_STAMPS = os.path.join(CACHE_DIR, "plot_stamps.json")
+PLOT_JOBS_DIR = os.path.join(CACHE_DIR, "plot_jobs")
+
+def plot_stamp(*parts):
+    return hashlib.sha256(json.dumps(parts, default=lambda v: np.asarray(v).tolist()).encode()).hexdigest()
+
+def plot_compound(compound, fit, x, y, plot_fname):
+    import matplotlib.pyplot as plt
+
+    x_plot = np.linspace(x.min(), x.max(), 200)
+    y_fit_offset = exp_offset_full(x_plot, fit.a, fit.b, fit.c)
 
-    # --- Plot per compound ---
     plt.figure(figsize=(10,6))
     plt.scatter(x, y, s=10, alpha=0.5, label="Fuel-corrected mean")
     plt.plot(x_plot, y_fit_offset, "m-", linewidth=2,
-             label=f"Offset Exp: y={c_fit:.3f}+{a_fit:.3f}·exp({b_fit:.4f}x)")
+             label=f"Offset Exp: y={fit.c:.3f}+{fit.a:.3f}·exp({fit.b:.4f}x)")
     plt.xlabel("Tyre age (laps)")
     plt.ylabel("Lap time (s)")
-    plt.title(f"Exponential Fit for {COMPOUND}")
+    plt.title(f"Exponential Fit for {compound}")
     plt.legend()
     plt.grid(True, alpha=0.3)
-    plot_fname = os.path.join(PLOTS_DIR, f"exp_fit_offset_{COMPOUND}.png")
     plt.savefig(plot_fname, dpi=300)
     plt.close()
-    # print(f"Saved offset exponential fit plot for {COMPOUND} to {plot_fname}")
 
-    combined_fits.append((COMPOUND, (a_fit, b_fit, c_fit)))
+def plot_combined(curves, plot_fname):
+    import matplotlib.pyplot as plt
 
-# --- Combined plot for all compounds ---
-plt.figure(figsize=(10,6))
-colors = {"SOFT": "red", "MEDIUM": "yellow", "HARD": "grey"}
-x_plot = np.linspace(0, 30, 300)
-for compound, params in combined_fits:
-    a_fit, b_fit, c_fit = params
-    y_plot = exp_offset_full(x_plot, a_fit, b_fit, c_fit)
-    plt.plot(x_plot, y_plot, color=colors.get(compound, "black"), linewidth=2,
-             label=f"{compound}: y={c_fit:.2f}+{a_fit:.2f}·exp({b_fit:.4f}x)")
+    plt.figure(figsize=(10,6))
+    colors = {"SOFT": "red", "MEDIUM": "yellow", "HARD": "grey"}
+    x_plot = np.linspace(0, 30, 300)
+    for compound, fit, _, _ in curves:
+        y_plot = exp_offset_full(x_plot, fit.a, fit.b, fit.c)
+        plt.plot(x_plot, y_plot, color=colors.get(compound, "black"), linewidth=2,
+                 label=f"{compound}: y={fit.c:.2f}+{fit.a:.2f}·exp({fit.b:.4f}x)")
 
-plt.xlabel("Tyre age (laps)")
-plt.ylabel("Lap time (s)")
-plt.title("Offset Exponential Fits for All Compounds")
-plt.grid(True, alpha=0.3)
-plt.legend()
-combined_plot_fname = os.path.join(PLOTS_DIR, "exp_fit_offset_all_compounds.png")
-plt.savefig(combined_plot_fname, dpi=300)
-plt.close()
-# print(f"Saved combined offset exponential fit plot to {combined_plot_fname}")
+    plt.xlabel("Tyre age (laps)")
+    plt.ylabel("Lap time (s)")
+    plt.title("Offset Exponential Fits for All Compounds")
+    plt.grid(True, alpha=0.3)
+    plt.legend()
+    plt.savefig(plot_fname, dpi=300)
+    plt.close()
+
+def plot_curves(curves):
+    """Render the per-compound and combined plots, skipping any whose inputs are unchanged.
+
+    Compounds without any fitted tyre age have nothing to draw and are left out.
+    """
+    curves = [curve for curve in curves if len(curve[2])]
+    os.makedirs(PLOTS_DIR, exist_ok=True)
+    stamps = {}
+    if os.path.exists(PLOT_STAMPS):
+        with open(PLOT_STAMPS, "r") as f:
+            stamps = json.load(f)
+
+    jobs = [(os.path.join(PLOTS_DIR, f"exp_fit_offset_{compound}.png"),
+             plot_stamp(compound, fit, x, y), plot_compound, (compound, fit, x, y))
+            for compound, fit, x, y in curves]
+    jobs.append((os.path.join(PLOTS_DIR, "exp_fit_offset_all_compounds.png"),
+                 plot_stamp([(compound, fit) for compound, fit, _, _ in curves]), plot_combined, (curves,)))
+
+    for plot_fname, stamp, render, args in jobs:
+        # The file's mtime is stamped too, so a PNG replaced on disk is redrawn
+        if os.path.exists(plot_fname) and stamps.get(plot_fname) == [stamp, os.stat(plot_fname).st_mtime_ns]:
+            continue
+        render(*args, plot_fname)
+        stamps[plot_fname] = [stamp, os.stat(plot_fname).st_mtime_ns]
+
+    with open(PLOT_STAMPS, "w") as f:
+        json.dump(stamps, f)
 
+def plot_curves_in_background(curves):
+    """Hand the plots to a detached ``--render-plots`` process and return immediately.
 
+    The child gets no stdout/stderr of ours, so a caller reading our output to
+    EOF is not held up by it.
+    """
+    os.makedirs(PLOT_JOBS_DIR, exist_ok=True)
+    job_path = os.path.join(PLOT_JOBS_DIR, f"{os.getpid()}_{time.time_ns()}.json")
+    with open(job_path, "w") as f:
+        json.dump([{"compound": compound, **curve_to_entry(fit, x, y)} for compound, fit, x, y in curves], f)
+
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), "--render-plots", job_path],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+
+def render_plot_job(job_path):
+    try:
+        with open(job_path, "r") as f:
+            entries = json.load(f)
+        plot_curves([(entry["compound"], *entry_to_curve(entry)) for entry in entries])
+    finally:
+        os.remove(job_path)
 
 # --- Output equations as JSON so C# can read them ---
-results = {}
-for compound, (a_fit, b_fit, c_fit) in combined_fits:
-    results[compound] = {
-        "a": float(a_fit),
-        "b": float(b_fit),
-        "c": float(c_fit),
-        "equation": f"y = {c_fit:.3f} + {a_fit:.3f}·exp({b_fit:.4f}x)"
-    }
+def json_number(value):
+    """``value`` as a float, or None where JSON has no number for it (NaN, ±inf)."""
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+def curves_to_json(curves):
+    results = {}
+    for compound, fit, _, _ in curves:
+        results[compound] = {
+            "a": json_number(fit.a),
+            "b": json_number(fit.b),
+            "c": json_number(fit.c),
+            "equation": f"y = {fit.c:.3f} + {fit.a:.3f}·exp({fit.b:.4f}x)",
+            "success": bool(fit.success),
+            "message": fit.message,
+        }
+    return results
+
+# --- Curve server ---
+# Fitted curves by (country, year, session_type, compound), kept for the server's lifetime
+_curve_results = {}
+
+def serve(stdin=sys.stdin, stdout=sys.stdout):
+    """Answer curve requests over a JSON-lines protocol until stdin closes.
+
+    Each request line is an object with optional "country", "year",
+    "session_type" and "compounds" keys (defaulting to the user parameters);
+    each reply line is the same JSON the script prints, or {"error": "..."}.
+    Parsed sessions and fitted curves stay in memory between requests and no
+    plots are rendered.
+    """
+    for line in stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            country = request.get("country", COUNTRY)
+            year = int(request.get("year", YEAR))
+            session_type = request.get("session_type", SESSION_TYPE)
+            compounds = [c.upper() for c in request.get("compounds", COMPOUNDS)]
+
+            missing = [c for c in compounds if (country, year, session_type, c) not in _curve_results]
+            if missing:
+                for compound, fit, _, _ in compute_curves(country, year, session_type, missing):
+                    _curve_results[country, year, session_type, compound] = fit
+            reply = curves_to_json([(c, _curve_results[country, year, session_type, c], None, None)
+                                    for c in compounds])
+        except Exception as exc:
+            reply = {"error": f"{type(exc).__name__}: {exc}"}
+        stdout.write(json.dumps(reply) + "\n")
+        stdout.flush()
+
+# --- Shared-memory lap table ---
+class SharedLapTable:
+    """Stint-lap column groups published once in a shared memory block.
+
+    Every column of every group is stored end to end; ``layout`` is a small
+    picklable description that other processes pass to ``attach_lap_table``
+    to read a group's columns as zero-copy, read-only array views.
+    """
+
+    def __init__(self, groups, names=STINT_LAP_COLUMNS):
+        bounds, start = {}, 0
+        for key, columns in groups.items():
+            stop = start + len(columns[names[0]])
+            bounds[key] = (start, stop)
+            start = stop
+        filled = [columns for columns in groups.values() if len(columns[names[0]])]
+        dtypes = {name: np.result_type(*[columns[name] for columns in filled]) if filled
+                  else np.dtype(np.float64) for name in names}
+
+        offsets, size = {}, 0
+        for name in names:
+            offsets[name] = size
+            # Keep every column 8-byte aligned
+            size += -(-start * dtypes[name].itemsize // 8) * 8
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.layout = {"name": self.shm.name, "rows": start, "groups": bounds,
+                       "columns": [(name, dtypes[name].str, offsets[name]) for name in names]}
+
+        views = lap_table_views(self.shm, self.layout)
+        for key, (lo, hi) in bounds.items():
+            for name in names:
+                views[name][lo:hi] = groups[key][name]
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def lap_table_views(shm, layout):
+    return {name: np.ndarray(layout["rows"], dtype=dtype, buffer=shm.buf, offset=offset)
+            for name, dtype, offset in layout["columns"]}
+
+# Shared tables this process has attached to, by block name
+_attached_lap_tables = {}
+
+def attach_lap_table(layout, key):
+    """Columns of group ``key`` of a published SharedLapTable, without copying."""
+    name = layout["name"]
+    if name not in _attached_lap_tables:
+        # Leave the block to the publishing process's resource tracker (Python 3.13+)
+        track = {"track": False} if sys.version_info >= (3, 13) else {}
+        shm = shared_memory.SharedMemory(name=name, **track)
+        views = lap_table_views(shm, layout)
+        for column in views.values():
+            column.flags.writeable = False
+        _attached_lap_tables[name] = (shm, views)
+    lo, hi = layout["groups"][key]
+    return {column: values[lo:hi] for column, values in _attached_lap_tables[name][1].items()}
+
+# --- Live session mode ---
+LIVE_POLL_SECONDS = 10.0  # time between polls of a live session
+LIVE_LAP_GRACE = 300.0    # seconds an unfinished lap may hold the watermark back
+
+class LiveCurves:
+    """Degradation curves of one session, updated as its laps arrive.
+
+    Each poll only asks for laps starting at or after the watermark. A
+    stint's laps are taken in once the stint is over (its driver has started
+    another one, or on ``flush``), so the push lap filter and fuel correction
+    see the whole stint exactly as compound_curve does. The sequential anomaly
+    filter walks a compound's laps in tyre-age order, so it is re-run over
+    the compound's fuel-corrected laps (a few hundred numbers) whenever they
+    change, and the per-age statistics are rebuilt from its survivors with
+    aggregate_by_age on every refit. The fit of those per-age means is
+    warm-started from the previous (a, b, c). After ``flush`` the curves match
+    compound_curve on the whole session.
+    """
+
+    def __init__(self, session, compounds=COMPOUNDS, **overrides):
+        self.session = session
+        self.compounds = [compound.upper() for compound in compounds]
+        self.params = pipeline_params(**overrides)
+        self.fits = {}         # compound -> (fit, x, y)
+        self.watermark = None  # date_start from which laps still need fetching
+        self._seen = set()     # (driver, lap_number) of every finished lap handled
+        self._laps = {}        # (driver, lap_number) -> lap time, for laps not yet in a finished stint
+        self._stints = []
+        self._corrected = defaultdict(list)  # compound -> [(driver, stint_number, lap_number, tyre_age, time)]
+
+    def poll(self):
+        """Fetch the session's stints and new laps and apply them; returns the compounds refitted."""
+        stints = fetch_json(f"{OPENF1_API}/stints?session_key={self.session}")
+        laps_url = f"{OPENF1_API}/laps?session_key={self.session}"
+        if self.watermark:
+            laps_url += f"&date_start>={quote(self.watermark)}"
+        return self.update(stints, fetch_json(laps_url))
+
+    def update(self, stints, laps):
+        """Take in the unseen finished ``laps``, fold in the stints that are over and refit."""
+        unfinished = []
+        for lap in laps:
+            key = (lap.get("driver_number"), lap.get("lap_number"))
+            if None in key or key in self._seen:
+                continue
+            sectors = [lap.get(f"duration_sector_{i}") for i in (1, 2, 3)]
+            if None in sectors and not lap.get("is_pit_out_lap"):
+                unfinished.append(lap)
+                continue
+            self._seen.add(key)
+            if not lap.get("is_pit_out_lap"):
+                self._laps[key] = sum(sectors)
+        self.advance_watermark(laps, unfinished)
+
+        self._stints = [stint for stint in stints if stint.get("compound") and stint.get("driver_number") is not None
+                        and None not in (stint.get("lap_start"), stint.get("lap_end"))]
+        last_start = defaultdict(lambda: -1)
+        for stint in self._stints:
+            last_start[stint["driver_number"]] = max(last_start[stint["driver_number"]], stint["lap_start"])
+        return self.fold(lambda stint: stint["lap_start"] < last_start[stint["driver_number"]])
+
+    def flush(self):
+        """Fold in every stint still running, e.g. once the session is over."""
+        return self.fold(lambda stint: True)
+
+    def fold(self, finished):
+        changed = set()
+        for stint in self._stints:
+            if not finished(stint):
+                continue
+            driver, start, end = stint["driver_number"], stint["lap_start"], stint["lap_end"]
+            keys = [(driver, n) for n in range(start, end) if (driver, n) in self._laps]
+            times = np.array([self._laps.pop(key) for key in keys])
+            if end - start > self.params["min_stint_laps"] and len(keys):
+                changed |= self.add_stint(stint, np.array([n for _, n in keys]), times)
+        # Laps outside every finished stint (in-laps) will never be used
+        for driver, lap_number in list(self._laps):
+            if any(st["driver_number"] == driver and st["lap_start"] > lap_number and finished(st)
+                   for st in self._stints):
+                del self._laps[driver, lap_number]
+
+        refitted = [compound for compound in self.compounds if compound in changed]
+        for compound in refitted:
+            self.fits[compound] = self.refit(compound)
+        return refitted
+
+    def add_stint(self, stint, lap_numbers, lap_times):
+        """Filter and fuel-correct one finished stint's laps as compound_curve does."""
+        params = self.params
+        stint_length = stint["lap_end"] - stint["lap_start"]
+        keep = ((lap_numbers != stint["lap_start"])
+                & (lap_times > np.median(lap_times) - params["push_lap_margin"]))
+        laps_done = lap_numbers[keep] - stint["lap_start"]
+        corrected = lap_times[keep] - np.maximum(0, stint_length + 2 - laps_done) * params["seconds_saved_per_lap_fuel"]
+        tyre_ages = int(stint.get("tyre_age_at_start") or 0) + laps_done
+
+        compound = stint["compound"].upper()
+        self._corrected[compound] += [(stint["driver_number"], stint.get("stint_number"), lap_number, age, time)
+                                      for lap_number, age, time in zip(lap_numbers[keep].tolist(),
+                                                                       tyre_ages.tolist(), corrected.tolist())]
+        return {compound} if len(corrected) else set()
+
+    def advance_watermark(self, laps, unfinished):
+        starts = [lap["date_start"] for lap in laps if lap.get("date_start")]
+        if not starts:
+            return
+        newest = max(starts, key=parse_time)
+        # Unfinished laps keep the watermark at their start, unless they are long overdue
+        cutoff = parse_time(newest) - LIVE_LAP_GRACE
+        held = [lap["date_start"] for lap in unfinished
+                if lap.get("date_start") and parse_time(lap["date_start"]) >= cutoff]
+        self.watermark = min(held, key=parse_time) if held else newest
+
+    def refit(self, compound):
+        # Laps in the order build_stint_laps would join them, so ties in tyre age break the same way
+        order = {(st["driver_number"], st.get("stint_number")): i for i, st in enumerate(self._stints)}
+        laps = sorted(self._corrected[compound], key=lambda lap: (order.get(lap[:2], len(order)), lap[2]))
+        rows = drop_anomalies({"tyre_age": np.array([lap[3] for lap in laps], dtype=np.int64),
+                               "fuel_corrected_time_zero": np.array([lap[4] for lap in laps])},
+                              self.params["threshold"])
+        ages, counts, means, _ = aggregate_by_age(rows["tyre_age"], rows["fuel_corrected_time_zero"])
+
+        previous = self.fits.get(compound)
+        b0 = previous[0].b if previous and previous[0].success else None
+        return fit_curve(ages, counts, means, self.params["min_tyre_age"], self.params["weight_fit_by_count"],
+                         bracket=tuple(self.params["fit_b_bracket"]), grid_size=self.params["fit_b_grid"], b0=b0)
+
+    def curves(self):
+        """The current (compound, fit, x, y) of every compound fitted so far."""
+        return [(compound, *self.fits[compound]) for compound in self.compounds if compound in self.fits]
+
+def run_live(session, compounds, poll_seconds=LIVE_POLL_SECONDS, polls=None, stdout=sys.stdout):
+    """Poll a live session and write its curves as a JSON line whenever they change.
+
+    Runs until interrupted, or for ``polls`` polls after which the stints
+    still running are flushed in as well.
+    """
+    live = LiveCurves(session, compounds)
+
+    def report(refitted):
+        if refitted:
+            stdout.write(json.dumps(curves_to_json(live.curves())) + "\n")
+            stdout.flush()
+
+    done = 0
+    while polls is None or done < polls:
+        try:
+            report(live.poll())
+        except Exception as exc:
+            # A failed poll is retried on the next one
+            warnings.warn(f"poll of session {session} failed: {exc}")
+        done += 1
+        if polls is None or done < polls:
+            time.sleep(poll_seconds)
+    report(live.flush())
+    return live
+
+# --- Batch mode ---
+def cached_events(session_type):
+    """(country, year) of every catalog event with stints or laps already in the cache."""
+    events = set()
+    for session in session_catalog().find(session_type=session_type):
+        if any(cached_path(fname) for _, fname in session_targets(session["session_key"])):
+            events.add((session["country_name"], session["year"]))
+    return sorted(events)
+
+def parse_event(spec):
+    country, sep, year = spec.rpartition(":")
+    if not sep or not country or not year.isdigit():
+        raise argparse.ArgumentTypeError(f"expected COUNTRY:YEAR, got {spec!r}")
+    return country, int(year)
+
+# Connections a forked worker inherited from the parent, kept open but never used
+_inherited = []
+
+def _init_worker():
+    """Give a forked batch worker its own SQLite connections and HTTP session.
+
+    SQLite connections must not be used across fork, and a pooled session
+    would share keep-alive sockets with the parent and sibling workers. The
+    inherited ones are only dropped, since closing them could checkpoint or
+    unlock the parent's databases; each is reopened on first use.
+    """
+    global _lap_store, _stats_store, _http_session, _http_pool_size, _http_lock, _rate_limiter
+    _inherited.extend(obj for obj in (_lap_store, _stats_store, _http_session) if obj is not None)
+    _lap_store = _stats_store = _http_session = _http_pool_size = _rate_limiter = None
+    _http_lock = threading.Lock()
+
+def _batch_worker(event):
+    global LAP_STORE
+    country, year, session_type, compounds, LAP_STORE = event
+    record = {"country": country, "year": year, "session_type": session_type}
+    try:
+        record["curves"] = curves_to_json(compute_curves(country, year, session_type, compounds))
+    except Exception as exc:
+        record["error"] = f"{type(exc).__name__}: {exc}"
+    return record
+
+def _shared_curve_worker(task):
+    layout, key, params = task
+    compound = key[1]
+    return compound_curve(attach_lap_table(layout, key), compound, params)
+
+def fit_batch_shared(events, session_type, compounds, workers=None):
+    """Fit ``events`` with each event's laps parsed once, in this process.
+
+    The joined stint-lap columns of every event and compound that is not in
+    the result cache go into one SharedLapTable. Pool workers attach to it
+    and run the per-compound chain on their slice, so no worker parses laps.
+    """
+    params = pipeline_params()
+    records, curves, groups, digests = [], {}, {}, {}
+    for i, (country, year) in enumerate(events):
+        records.append({"country": country, "year": year, "session_type": session_type})
+        try:
+            session_keys = load_sessions(country, year, session_type)
+            if not session_keys:
+                raise LookupError(f"no {session_type} sessions found for {country} {year}")
+            prefetch([target for session in session_keys for target in session_targets(session)])
+            digests[i] = inputs_digest(session_keys)
+            for compound, curve in cached_curves(digests[i], compounds, params).items():
+                curves[i, compound] = curve
+            if any((i, compound) not in curves for compound in compounds):
+                stint_laps = build_stint_laps(session_keys, params["min_stint_laps"])
+                for compound in compounds:
+                    if (i, compound) not in curves:
+                        groups[i, compound] = stint_laps.get(compound.upper()) or concat_columns([])
+        except Exception as exc:
+            records[i]["error"] = f"{type(exc).__name__}: {exc}"
+
+    if groups:
+        with (SharedLapTable(groups) as table,
+              ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool):
+            futures = {key: pool.submit(_shared_curve_worker, (table.layout, key, params)) for key in groups}
+            for key, future in futures.items():
+                try:
+                    curves[key] = future.result()
+                except Exception as exc:
+                    records[key[0]].setdefault("error", f"{type(exc).__name__}: {exc}")
+                    continue
+                if digests[key[0]] is not None:
+                    store_cached_curve(curve_cache_path(digests[key[0]], key[1], params), *curves[key])
+
+    for i, record in enumerate(records):
+        if "error" not in record:
+            record["curves"] = curves_to_json([(compound, *curves[i, compound]) for compound in compounds])
+    return records
+
+def run_batch(events, session_type, compounds, out_path, workers=None, shared=False):
+    """Fit every (country, year) in ``events`` in a process pool and write one JSON file.
+
+    Missing files for all events are downloaded up front in this process, so
+    the shared rate limit holds. With ``shared`` the laps are also parsed here
+    and handed to the workers through shared memory (see fit_batch_shared);
+    otherwise each worker parses its own events.
+    """
+    targets = []
+    for country, year in events:
+        try:
+            targets += [target for session in load_sessions(country, year, session_type)
+                        for target in session_targets(session)]
+        except Exception as exc:
+            warnings.warn(f"could not list sessions for {country} {year}: {exc}")
+    try:
+        prefetch(targets)
+    except Exception as exc:
+        # The affected events retry on their own and report the error in their record
+        warnings.warn(f"prefetch failed: {exc}")
+
+    if shared:
+        records = fit_batch_shared(events, session_type, compounds, workers)
+    else:
+        jobs = [(country, year, session_type, compounds, LAP_STORE) for country, year in events]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            records = list(pool.map(_batch_worker, jobs))
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(records, f, indent=2)
+    os.replace(tmp_path, out_path)
+    return records
+
+def main(argv=None):
+    global LAP_STORE
+    parser = argparse.ArgumentParser(description="Fit tyre degradation curves from OpenF1 practice data.")
+    parser.add_argument("--serve", action="store_true",
+                        help="keep running and answer JSON-lines curve requests on stdin/stdout")
+    parser.add_argument("--plots", choices=["sync", "background", "none"], default="sync",
+                        help="render plots after printing the JSON (sync), in a detached process "
+                             "(background), or not at all (none)")
+    parser.add_argument("--no-plots", dest="plots", action="store_const", const="none",
+                        help="same as --plots none")
+    parser.add_argument("--batch", nargs="+", metavar="EVENT",
+                        help="fit several events (COUNTRY:YEAR, or 'all' for every cached event) "
+                             "in a process pool and write them to --out")
+    parser.add_argument("--out", default="batch_results.json", help="consolidated results file for --batch")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for --batch")
+    parser.add_argument("--shared-laps", action="store_true",
+                        help="parse every --batch event once in the parent and share the laps "
+                             "with the workers through shared memory")
+    parser.add_argument("--store", choices=["files", "sqlite"], default=None,
+                        help=f"lap storage backend (default: {LAP_STORE})")
+    parser.add_argument("--refresh-catalog", nargs="*", type=int, metavar="YEAR",
+                        help="re-fetch the session catalog for YEARs (default: every stale year "
+                             "in it, and the current one) and exit")
+    parser.add_argument("--sync", nargs="*", type=int, metavar="YEAR",
+                        help="download missing and still-live sessions of YEARs (default: the "
+                             "current one) for the configured session type and exit")
+    parser.add_argument("--compress-cache", choices=["none", "gzip", "zstd"],
+                        help="rewrite the cached JSON downloads with this codec and exit")
+    parser.add_argument("--live", type=int, metavar="SESSION_KEY",
+                        help="poll a live session and print updated curves as JSON lines")
+    parser.add_argument("--poll-seconds", type=float, default=LIVE_POLL_SECONDS,
+                        help="time between polls for --live")
+    parser.add_argument("--polls", type=int, default=None, help="stop --live after this many polls")
+    parser.add_argument("--pooled", nargs="+", metavar="EVENT",
+                        help="print curves pooled over events (COUNTRY:YEAR, COUNTRY for every year "
+                             "in the session catalog, or 'all' for every cached event) from the "
+                             "per-session fuel-corrected lap store")
+    parser.add_argument("--render-plots", metavar="JOB", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.store:
+        LAP_STORE = args.store
+
+    if args.render_plots:
+        render_plot_job(args.render_plots)
+        return
+
+    if args.refresh_catalog is not None:
+        years = args.refresh_catalog
+        if not years:
+            catalog = session_catalog()
+            years = sorted({int(year) for year in catalog.years} | {datetime.now(timezone.utc).year})
+        fetched = refresh_catalog(years, force=bool(args.refresh_catalog))
+        print(f"Fetched sessions for {len(fetched)} years; catalog has "
+              f"{len(session_catalog().sessions)} sessions", file=sys.stderr)
+        return
+
+    if args.compress_cache:
+        before, after = compress_cache(args.compress_cache)
+        print(f"Cached JSON: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB", file=sys.stderr)
+        return
+
+    if args.sync is not None:
+        years = args.sync or [datetime.now(timezone.utc).year]
+        fetched = sync_cache(years)
+        print(f"Downloaded {len(fetched)} files", file=sys.stderr)
+        return
+
+    if args.serve:
+        serve()
+        return
+
+    if args.live is not None:
+        try:
+            run_live(args.live, COMPOUNDS, args.poll_seconds, args.polls)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if args.pooled:
+        events = []
+        for spec in args.pooled:
+            if spec == "all":
+                events += cached_events(SESSION_TYPE)
+            elif ":" in spec:
+                try:
+                    events.append(parse_event(spec))
+                except argparse.ArgumentTypeError as exc:
+                    parser.error(str(exc))
+            else:
+                years = {s["year"] for s in session_catalog().find(country_name=spec, session_type=SESSION_TYPE)}
+                events += [(spec, year) for year in sorted(years)]
+        session_keys = [session for country, year in dict.fromkeys(events)
+                        for session in load_sessions(country, year, SESSION_TYPE)]
+        print(json.dumps(curves_to_json(pooled_curves(session_keys, COMPOUNDS))))
+        return
+
+    if args.batch:
+        events = []
+        for spec in args.batch:
+            if spec == "all":
+                events += cached_events(SESSION_TYPE)
+            else:
+                try:
+                    events.append(parse_event(spec))
+                except argparse.ArgumentTypeError as exc:
+                    parser.error(str(exc))
+        # Drop duplicates, keeping the order given
+        events = list(dict.fromkeys(events))
+        records = run_batch(events, SESSION_TYPE, COMPOUNDS, args.out, args.workers,
+                            args.shared_laps)
+        failed = sum("error" in record for record in records)
+        print(f"Wrote {len(records)} events ({failed} failed) to {args.out}", file=sys.stderr)
+        return
+
+    curves = compute_curves(COUNTRY, YEAR, SESSION_TYPE, COMPOUNDS)
+
+    # Print JSON to stdout before any plotting so callers get results first
+    print(json.dumps(curves_to_json(curves)))
+    sys.stdout.flush()
 
-# Print JSON to stdout
-print(json.dumps(results))
-sys.stdout.flush()
+    if args.plots == "sync":
+        plot_curves(curves)
+    elif args.plots == "background":
+        plot_curves_in_background(curves)
 
+if __name__ == "__main__":
+    main()
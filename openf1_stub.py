@@ -0,0 +1,192 @@
+"""Local stand-in for the OpenF1 API that serves the files in cache/.
+
+Run it and point get_curves.py at it with an empty working directory:
+
+    python openf1_stub.py --port 8000
+    OPENF1_API=http://127.0.0.1:8000/v1 python /path/to/get_curves.py
+
+With --replay SPEED each session's laps and stints are released over time,
+as if the session were running live from the moment it is first requested,
+SPEED times faster than real time:
+
+    python openf1_stub.py --replay 60
+    OPENF1_API=http://127.0.0.1:8000/v1 python get_curves.py --live 9532
+"""
+import os
+import re
+import glob
+import gzip
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+def cache_filename(endpoint, query):
+    """Map an OpenF1 request onto the file name get_curves.py caches it under."""
+    params = {k: v[0] for k, v in parse_qs(query).items()}
+    if endpoint == "sessions":
+        return f"sessions_{params['country_name']}_{params['session_type']}_{params['year']}.json"
+    if endpoint in ("stints", "laps"):
+        return f"{endpoint}_{params['session_key']}.json"
+    raise KeyError(endpoint)
+
+def read_cached(path):
+    """Body of a cached file, which get_curves.py may have stored gzip- or zstd-compressed."""
+    for suffix in ("", ".gz", ".zst"):
+        if os.path.exists(path + suffix):
+            with open(path + suffix, "rb") as f:
+                body = f.read()
+            if suffix == ".gz":
+                return gzip.decompress(body)
+            if suffix == ".zst":
+                import zstandard
+
+                return zstandard.ZstdDecompressor().decompress(body)
+            return body
+    raise FileNotFoundError(path)
+
+def year_sessions(root, year):
+    """Bulk ``sessions?year=`` reply: every cached sessions file of that year, merged."""
+    sessions = {}
+    for suffix in ("", ".gz", ".zst"):
+        for path in glob.glob(os.path.join(root, f"sessions_*_{glob.escape(year)}.json{suffix}")):
+            sessions.update((s["session_key"], s) for s in json.loads(read_cached(path.removesuffix(suffix))))
+    return json.dumps(sorted(sessions.values(), key=lambda s: s["date_start"])).encode()
+
+# OpenF1 comparison filters, e.g. date_start>=2024-06-21T12:00:00+00:00 or lap_number>10
+_COMPARISON = re.compile(r"(\w+)(>=|<=|>|<)(.*)")
+
+def comparison_filters(query):
+    return [match.groups() for part in query.split("&")
+            if (match := _COMPARISON.fullmatch(unquote(part)))]
+
+def matches(record, field, op, value):
+    actual = record.get(field)
+    if actual is None:
+        return False
+    if isinstance(actual, (int, float)):
+        value = float(value)
+    elif field.startswith("date"):
+        actual, value = datetime.fromisoformat(actual), datetime.fromisoformat(value)
+    return {">=": actual >= value, "<=": actual <= value, ">": actual > value, "<": actual < value}[op]
+
+class ReplayClock:
+    """Session time for replays: each session starts at its first lap when first requested."""
+
+    def __init__(self, speed):
+        self.speed = speed
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def now(self, session, laps):
+        with self._lock:
+            if session not in self._started:
+                starts = [lap["date_start"] for lap in laps if lap.get("date_start")]
+                first = min(datetime.fromisoformat(start) for start in starts)
+                self._started[session] = (first, time.monotonic())
+            first, started = self._started[session]
+        return first + timedelta(seconds=(time.monotonic() - started) * self.speed)
+
+def replay_laps(laps, now):
+    """The laps started by ``now``; sector and lap times are hidden until they are over."""
+    released = []
+    for lap in laps:
+        if not lap.get("date_start"):
+            # Laps without a start time (usually the first out lap) are there from the start
+            released.append(lap)
+            continue
+        start = datetime.fromisoformat(lap["date_start"])
+        if start > now:
+            continue
+        lap = dict(lap)
+        elapsed = 0.0
+        for name in ("duration_sector_1", "duration_sector_2", "duration_sector_3"):
+            elapsed += lap.get(name) or 0.0
+            if start + timedelta(seconds=elapsed) > now:
+                lap[name] = None
+        if lap.get("lap_duration") and start + timedelta(seconds=lap["lap_duration"]) > now:
+            lap["lap_duration"] = None
+        released.append(lap)
+    return released
+
+def replay_stints(stints, laps):
+    """Stints as they stood when ``laps`` (already replayed) were the latest laps."""
+    latest = {}
+    for lap in laps:
+        if lap.get("lap_number") is not None:
+            latest[lap["driver_number"]] = max(latest.get(lap["driver_number"], 0), lap["lap_number"])
+    released = []
+    for stint in stints:
+        last = latest.get(stint["driver_number"])
+        if last is None or stint["lap_start"] is None or stint["lap_start"] > last:
+            continue
+        released.append({**stint, "lap_end": min(stint["lap_end"], last)})
+    return released
+
+class StubHandler(BaseHTTPRequestHandler):
+    root = DEFAULT_ROOT
+    latency = 0.0  # seconds to wait before each reply, to mimic a slow network
+    replay = None  # ReplayClock, or None to serve whole sessions
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+        params = parse_qs(url.query)
+        time.sleep(self.latency)
+        try:
+            if endpoint == "sessions" and set(params) == {"year"}:
+                body = year_sessions(self.root, params["year"][0])
+            else:
+                body = read_cached(os.path.join(self.root, cache_filename(endpoint, url.query)))
+                filters = comparison_filters(url.query)
+                if endpoint in ("stints", "laps") and (filters or self.replay):
+                    body = json.dumps(self.select(endpoint, params["session_key"][0], json.loads(body),
+                                                  filters)).encode()
+        except (KeyError, OSError, ValueError):
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def select(self, endpoint, session, records, filters):
+        if self.replay:
+            laps = records if endpoint == "laps" else json.loads(
+                read_cached(os.path.join(self.root, f"laps_{session}.json")))
+            released = replay_laps(laps, self.replay.now(session, laps))
+            records = released if endpoint == "laps" else replay_stints(records, released)
+        return [record for record in records if all(matches(record, *f) for f in filters)]
+
+    def log_message(self, format, *args):
+        pass
+
+def make_server(root=DEFAULT_ROOT, host="127.0.0.1", port=0, latency=0.0, replay=None):
+    """Create (but do not start) a stub server; port 0 picks a free port.
+
+    ``replay`` is a speed-up factor for replaying sessions live (see ReplayClock).
+    """
+    clock = ReplayClock(replay) if replay else None
+    handler = type("Handler", (StubHandler,), {"root": root, "latency": latency, "replay": clock})
+    return ThreadingHTTPServer((host, port), handler)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", default=DEFAULT_ROOT)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to delay every reply")
+    parser.add_argument("--replay", type=float, metavar="SPEED",
+                        help="release laps and stints over time, SPEED times faster than live")
+    args = parser.parse_args()
+
+    server = make_server(args.root, args.host, args.port, args.latency, args.replay)
+    print(f"Serving {args.root} on http://{args.host}:{server.server_port}/v1")
+    server.serve_forever()
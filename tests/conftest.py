@@ -0,0 +1,36 @@
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import get_curves as gc
+import openf1_stub
+
+CACHE = os.path.join(ROOT, "cache")
+
+@pytest.fixture
+def fresh_cache(tmp_path, monkeypatch):
+    """An empty working directory, with every in-process cache of get_curves cleared."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(gc, "_catalog", None)
+    monkeypatch.setattr(gc, "_stint_laps_by_session", {})
+    monkeypatch.setattr(gc, "_lap_store", None)
+    monkeypatch.setattr(gc, "_stats_store", None)
+    monkeypatch.setattr(gc, "FETCH_RATE_LIMIT", 0)
+    return tmp_path
+
+@pytest.fixture
+def stub_api(monkeypatch, request):
+    """A stub OpenF1 server over the repository's cache/; parametrize indirectly with a replay speed."""
+    replay = getattr(request, "param", None)
+    server = openf1_stub.make_server(CACHE, replay=replay)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(gc, "OPENF1_API", f"http://127.0.0.1:{server.server_port}/v1")
+    yield gc.OPENF1_API
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+import get_curves as gc
+from conftest import ROOT
+
+def strict_json(path):
+    def reject(token):
+        raise ValueError(f"invalid JSON constant {token}")
+    with open(path) as f:
+        return json.load(f, parse_constant=reject)
+
+@pytest.fixture
+def sqlite_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(gc, "LAP_STORE", "sqlite")
+    monkeypatch.setattr(gc, "LAP_STORE_PATH", str(tmp_path / "laps.sqlite"))
+    monkeypatch.setattr(gc, "_lap_store", None)
+    monkeypatch.setattr(gc, "RESULTS_DIR", str(tmp_path / "results"))
+    yield
+    gc.lap_store().close()
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_batch_results_are_strict_json_with_fit_status(sqlite_store, tmp_path, shared):
+    out = tmp_path / "batch_results.json"
+    gc.run_batch([("Australia", 2024), ("Austria", 2025)], "Practice", gc.COMPOUNDS, str(out),
+                 workers=2, shared=shared)
+    records = {record["country"]: record for record in strict_json(out)}
+
+    for record in records.values():
+        assert "error" not in record
+        for curve in record["curves"].values():
+            assert {"a", "b", "c", "success", "message"} <= set(curve)
+    hard = records["Australia"]["curves"]["HARD"]
+    assert hard["b"] is None and not hard["success"]
+    hard = records["Austria"]["curves"]["HARD"]
+    assert hard["b"] == pytest.approx(gc.FIT_B_BRACKET[1]) and not hard["success"]
+    assert "edge of the search bracket" in hard["message"]
+    assert records["Australia"]["curves"]["SOFT"]["success"]
+
+def test_worker_init_drops_inherited_connections(sqlite_store, monkeypatch):
+    for name in ("_inherited", "_stats_store", "_http_session", "_http_pool_size", "_http_lock", "_rate_limiter"):
+        monkeypatch.setattr(gc, name, getattr(gc, name))
+    gc._inherited = []
+    store, session = gc.lap_store(), gc.get_http_session()
+    gc._init_worker()
+    try:
+        assert gc._lap_store is None and gc._http_session is None
+        assert gc.lap_store() is not store
+        assert gc.get_http_session() is not session
+        assert store in gc._inherited and session in gc._inherited
+    finally:
+        gc.lap_store().close()
+        monkeypatch.setattr(gc, "_lap_store", store)
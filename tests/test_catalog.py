@@ -0,0 +1,35 @@
+import os
+import shutil
+
+import pytest
+
+import get_curves as gc
+from conftest import CACHE
+
+def seed(*events):
+    os.makedirs(gc.CACHE_DIR, exist_ok=True)
+    for event in events:
+        shutil.copy(os.path.join(CACHE, f"sessions_{event}.json"), gc.CACHE_DIR)
+
+def no_network(*args, **kwargs):
+    raise AssertionError("the catalog was refreshed")
+
+@pytest.mark.parametrize("event, year", [("Austria", 2024), ("Qatar", 2024)])
+def test_seeded_incomplete_event_is_not_refreshed(fresh_cache, monkeypatch, event, year):
+    seed(f"{event}_Practice_{year}")
+    monkeypatch.setattr(gc, "refresh_catalog", no_network)
+    sessions = gc.load_sessions(event, year, "Practice")
+    assert 0 < len(sessions) < 3
+
+def test_event_missing_from_seeded_catalog_is_fetched(fresh_cache, stub_api):
+    seed("Austria_Practice_2024")
+    assert gc.load_sessions("Spain", 2024, "Practice") == [9532, 9533, 9534]
+    assert "2024" in gc.session_catalog().years
+
+def test_incomplete_event_of_stale_bulk_fetched_year_is_refreshed(fresh_cache, stub_api, monkeypatch):
+    seed("Austria_Practice_2024")
+    gc.session_catalog().years["2024"] = gc.datetime(2024, 6, 1, tzinfo=gc.timezone.utc).timestamp()
+    refreshed = []
+    monkeypatch.setattr(gc, "refresh_catalog", lambda years, **kwargs: refreshed.extend(years))
+    gc.load_sessions("Austria", 2024, "Practice")
+    assert refreshed == [2024]
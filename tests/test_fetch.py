@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+
+import get_curves as gc
+from conftest import ROOT
+
+def test_cold_run_through_stub_matches_cached_run(fresh_cache, stub_api, monkeypatch):
+    curves = gc.curves_to_json(gc.compute_curves("Spain", 2024, "Practice", gc.COMPOUNDS))
+    for session in (9532, 9533, 9534):
+        assert gc.cached_path(f"laps_{session}.json")
+        assert gc.cached_path(f"stints_{session}.json")
+
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(gc, "_catalog", None)
+    expected = gc.curves_to_json(gc.compute_curves("Spain", 2024, "Practice", gc.COMPOUNDS))
+    assert curves == expected
+
+def test_fetch_settings_are_read_on_use(monkeypatch):
+    monkeypatch.setattr(gc, "FETCH_RATE_LIMIT", 5.0)
+    assert gc.get_rate_limiter().rate == 5.0
+    monkeypatch.setattr(gc, "FETCH_RATE_LIMIT", 0)
+    assert gc.get_rate_limiter().interval == 0.0
+
+    monkeypatch.setattr(gc, "FETCH_CONCURRENCY", 2)
+    session = gc.get_http_session()
+    assert session.get_adapter("http://").poolmanager.connection_pool_kw["maxsize"] == 2
+    monkeypatch.setattr(gc, "FETCH_CONCURRENCY", 6)
+    rebuilt = gc.get_http_session()
+    assert rebuilt is not session
+    assert rebuilt.get_adapter("http://").poolmanager.connection_pool_kw["maxsize"] == 6
+
+def test_streamed_and_cached_laps_decode_the_same(fresh_cache, stub_api):
+    streamed = gc.load_laps(9532)
+    os.remove(os.path.join(gc.CACHE_DIR, "laps_9532.npz"))
+    from_file = gc.load_laps(9532)
+    assert list(streamed) == list(gc.LAP_COLUMNS)
+    for name in gc.LAP_COLUMNS:
+        np.testing.assert_array_equal(streamed[name], from_file[name])
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import get_curves as gc
+
+# Mean fuel-corrected HARD lap times by tyre age, whose best rate lies outside the bracket
+EDGE_SERIES = {
+    "Austria 2025": ([2, 3, 4, 5, 7], [66.926, 66.7265, 67.17, 66.5468, 65.969]),
+    "Qatar 2024": ([2, 3, 4, 5, 6, 7, 8], [86.5105, 86.135, 85.872, 86.10866667, 86.30075, 85.96166667, 84.746]),
+}
+
+@pytest.mark.parametrize("name", EDGE_SERIES)
+def test_edge_of_bracket_fit_is_reported_as_failed(name):
+    x, y = EDGE_SERIES[name]
+    fit = gc.fit_exp_offset(x, y)
+    assert not fit.success
+    assert gc.FIT_B_BRACKET[0] <= fit.b <= gc.FIT_B_BRACKET[1]
+    assert "edge of the search bracket" in fit.message
+
+def test_rate_stays_in_bracket_on_noisy_series():
+    rng = np.random.default_rng(0)
+    x = np.arange(2, 20)
+    for _ in range(200):
+        b = rng.uniform(0.01, 0.1)
+        y = 80 + 0.5 * np.exp(b * x) + rng.normal(0, 0.3, len(x))
+        fit = gc.fit_exp_offset(x, y)
+        assert gc.FIT_B_BRACKET[0] <= fit.b <= gc.FIT_B_BRACKET[1]
+
+def test_recovers_rate_of_clean_series():
+    x = np.arange(1, 25)
+    fit = gc.fit_exp_offset(x, 90 + 0.8 * np.exp(0.05 * x))
+    assert fit.success
+    assert fit.b == pytest.approx(0.05, abs=1e-6)
+    assert fit.a == pytest.approx(0.8, rel=1e-4)
+
+def batch_matches_single(series):
+    batch = gc.fit_exp_offset_batch(series)
+    for i, (x, y) in enumerate(series):
+        fit = gc.fit_exp_offset(x, y)
+        assert batch.converged[i] == fit.success
+        if fit.success:
+            assert batch.b[i] == pytest.approx(fit.b, abs=1e-6)
+            assert batch.rss[i] == pytest.approx(fit.rss, rel=1e-9, abs=1e-12)
+    return batch
+
+def test_batch_matches_single_fits_on_clean_series():
+    x = np.arange(1, 25)
+    series = [(x, 90 + 0.8 * np.exp(b * x)) for b in (-0.08, -0.02, 0.03, 0.1)]
+    batch = batch_matches_single(series)
+    assert batch.converged.all()
+    np.testing.assert_allclose(batch.b, [-0.08, -0.02, 0.03, 0.1], atol=1e-6)
+
+def test_batch_matches_single_fits_on_noisy_series():
+    rng = np.random.default_rng(1)
+    series = []
+    for _ in range(100):
+        x = np.arange(2, rng.integers(6, 25))
+        series.append((x, 80 + rng.uniform(0.2, 2) * np.exp(rng.uniform(-0.1, 0.1) * x) + rng.normal(0, 0.3, len(x))))
+    batch_matches_single(series)
+
+def test_batch_rejects_edge_of_bracket_fits():
+    batch = gc.fit_exp_offset_batch(list(EDGE_SERIES.values()))
+    assert not batch.converged.any()
+    assert ((batch.b >= gc.FIT_B_BRACKET[0]) & (batch.b <= gc.FIT_B_BRACKET[1])).all()
+
+def test_batch_short_series_and_empty_batch():
+    batch = gc.fit_exp_offset_batch([([1, 2], [80.0, 80.1]), (np.arange(10), 80 + np.exp(0.05 * np.arange(10)))])
+    assert list(batch.converged) == [False, True]
+    assert np.isnan([batch.a[0], batch.b[0], batch.c[0]]).all()
+    assert np.isnan(batch.residuals[0, 2:]).all()
+
+    empty = gc.fit_exp_offset_batch([])
+    assert empty.b.shape == (0,) and not empty.converged.any()
@@ -0,0 +1,21 @@
+import subprocess
+import sys
+
+from conftest import ROOT
+
+HEAVY_MODULES = {"scipy", "matplotlib", "requests", "sklearn"}
+IMPORT_BUDGET_US = 500_000  # cumulative import time of get_curves, well above the ~50 ms it takes
+
+def test_import_is_lazy_and_within_budget():
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import get_curves"],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|").split("|"))
+        cumulative[name] = int(cumulative_us)
+
+    loaded = {name.split(".")[0] for name in cumulative}
+    assert not loaded & HEAVY_MODULES
+    assert cumulative["get_curves"] < IMPORT_BUDGET_US
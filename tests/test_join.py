@@ -0,0 +1,41 @@
+import os
+import re
+
+import numpy as np
+import pytest
+
+import get_curves as gc
+from conftest import CACHE, ROOT
+
+CACHED_SESSIONS = sorted({int(m.group(1)) for name in os.listdir(CACHE)
+                          if (m := re.fullmatch(r"stints_(\d+)\.json(\.gz|\.zst)?", name))})
+
+@pytest.fixture
+def both_backends(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(gc, "LAP_STORE_PATH", str(tmp_path / "laps.sqlite"))
+    monkeypatch.setattr(gc, "_lap_store", None)
+    monkeypatch.setattr(gc, "_stint_laps_by_session", {})
+    yield
+    gc.lap_store().close()
+
+def test_sessions_with_null_lap_ranges_are_cached():
+    assert {9462, 9508} <= set(CACHED_SESSIONS)
+
+@pytest.mark.parametrize("session", CACHED_SESSIONS)
+def test_file_and_sqlite_backends_agree(both_backends, monkeypatch, session):
+    files = gc.session_stint_laps(session)
+    monkeypatch.setattr(gc, "LAP_STORE", "sqlite")
+    monkeypatch.setattr(gc, "_stint_laps_by_session", {})
+    store = gc.session_stint_laps(session)
+    assert sorted(files) == sorted(store)
+    for compound in files:
+        for column in gc.STINT_LAP_COLUMNS:
+            np.testing.assert_array_equal(files[compound][column], store[compound][column])
+
+def test_null_fields_of_a_stint_get_defaults():
+    stints = [{"compound": "soft", "driver_number": 1, "lap_start": 1, "lap_end": 9,
+               "stint_number": None, "tyre_age_at_start": None},
+              {"compound": "HARD", "driver_number": 1, "lap_start": None, "lap_end": None},
+              {"compound": None, "driver_number": 2, "lap_start": 1, "lap_end": 9}]
+    assert list(gc.usable_stints(stints)) == [(1, -1, 1, 9, "SOFT", 0)]
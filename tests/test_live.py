@@ -0,0 +1,41 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+import get_curves as gc
+from conftest import ROOT
+
+SESSION = 9532
+
+def batch_curves(compounds=gc.COMPOUNDS):
+    rows = gc.session_stint_laps(SESSION)
+    return [(compound, *gc.compound_curve(rows[compound], compound)) for compound in compounds if compound in rows]
+
+def assert_same_curves(live, batch):
+    assert [compound for compound, *_ in live] == [compound for compound, *_ in batch]
+    for (_, fit, x, y), (_, expected, x_batch, y_batch) in zip(live, batch):
+        np.testing.assert_array_equal(x, x_batch)
+        np.testing.assert_allclose(y, y_batch, rtol=0, atol=1e-9)
+        np.testing.assert_allclose(fit[:4], expected[:4], rtol=1e-6, atol=1e-9)
+
+@pytest.fixture(autouse=True)
+def repo_cache(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(gc, "_stint_laps_by_session", {})
+    monkeypatch.setattr(gc, "FETCH_RATE_LIMIT", 0)
+
+def test_whole_session_poll_matches_batch(stub_api):
+    live = gc.LiveCurves(SESSION)
+    live.poll()
+    live.flush()
+    assert_same_curves(live.curves(), batch_curves())
+
+@pytest.mark.parametrize("stub_api", [3000.0], indirect=True)
+def test_replayed_session_matches_batch(stub_api):
+    out = io.StringIO()
+    live = gc.run_live(SESSION, gc.COMPOUNDS, poll_seconds=0.4, polls=6, stdout=out)
+    updates = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert len(updates) > 1
+    assert_same_curves(live.curves(), batch_curves())
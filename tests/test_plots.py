@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+import get_curves as gc
+from conftest import ROOT
+
+@pytest.fixture
+def plot_dirs(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(gc, "PLOTS_DIR", str(tmp_path / "plots"))
+    monkeypatch.setattr(gc, "PLOT_STAMPS", str(tmp_path / "plot_stamps.json"))
+    monkeypatch.setattr(gc, "PLOT_JOBS_DIR", str(tmp_path / "plot_jobs"))
+    monkeypatch.setattr(gc, "RESULTS_DIR", str(tmp_path / "results"))
+    return tmp_path
+
+def test_compound_without_points_is_not_plotted(plot_dirs):
+    curves = gc.compute_curves("Bahrain", 2025, "Practice", gc.COMPOUNDS)
+    assert not len(dict((c, x) for c, _, x, _ in curves)["SOFT"])
+    gc.plot_curves(curves)
+    assert sorted(os.listdir(gc.PLOTS_DIR)) == ["exp_fit_offset_HARD.png", "exp_fit_offset_MEDIUM.png",
+                                                 "exp_fit_offset_all_compounds.png"]
+
+def test_failed_plot_job_is_removed(plot_dirs):
+    os.makedirs(gc.PLOT_JOBS_DIR)
+    job_path = os.path.join(gc.PLOT_JOBS_DIR, "broken.json")
+    with open(job_path, "w") as f:
+        f.write("[{")
+    with pytest.raises(ValueError):
+        gc.render_plot_job(job_path)
+    assert not os.listdir(gc.PLOT_JOBS_DIR)
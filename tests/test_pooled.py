@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+import get_curves as gc
+from conftest import ROOT
+
+@pytest.fixture
+def lap_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(gc, "STATS_STORE_PATH", str(tmp_path / "lap_stats.sqlite"))
+    monkeypatch.setattr(gc, "_stats_store", None)
+    yield
+    gc.stats_store().close()
+
+@pytest.mark.parametrize("event, year", [("Spain", 2024), ("Bahrain", 2025), ("Hungary", 2024)])
+def test_pooled_event_matches_compute_curves(lap_store, event, year):
+    session_keys = gc.load_sessions(event, year, "Practice")
+    pooled = gc.pooled_curves(session_keys, gc.COMPOUNDS)
+    expected = gc.compute_curves(event, year, "Practice", gc.COMPOUNDS)
+    for (compound, fit, x, y), (_, expected_fit, expected_x, expected_y) in zip(pooled, expected):
+        np.testing.assert_array_equal(x, expected_x)
+        np.testing.assert_allclose(y, expected_y, rtol=1e-12)
+        np.testing.assert_allclose(fit[:4], expected_fit[:4], rtol=1e-9, equal_nan=True)
+
+def test_pooling_twice_reads_the_store(lap_store, monkeypatch):
+    session_keys = gc.load_sessions("Spain", 2024, "Practice")
+    first = gc.pooled_stats(session_keys, "MEDIUM")
+    monkeypatch.setattr(gc, "store_session_laps", lambda *args: pytest.fail("laps were stored again"))
+    for got, expected in zip(gc.pooled_stats(session_keys, "MEDIUM"), first):
+        np.testing.assert_array_equal(got, expected)
@@ -0,0 +1,69 @@
+import os
+import shutil
+
+import pytest
+
+import get_curves as gc
+from conftest import CACHE
+
+SPAIN = ("Spain", 2024, "Practice")
+CHANGED = {"seconds_saved_per_lap_fuel": 0.05, "weight_fit_by_count": True, "min_stint_laps": 4,
+           "push_lap_margin": 2.0, "threshold": 1.05, "min_tyre_age": 3, "fit_b_bracket": [-0.4, 0.4],
+           "fit_b_grid": 100}
+
+@pytest.fixture
+def spain_cache(fresh_cache, monkeypatch):
+    os.makedirs(gc.CACHE_DIR)
+    shutil.copy(os.path.join(CACHE, "sessions_Spain_Practice_2024.json"), gc.CACHE_DIR)
+    for session in (9532, 9533, 9534):
+        for _, fname in gc.session_targets(session):
+            shutil.copy(os.path.join(CACHE, fname), gc.CACHE_DIR)
+    monkeypatch.setattr(gc, "RESULTS_DIR", os.path.join(gc.CACHE_DIR, "results"))
+
+    builds = []
+    build_stint_laps = gc.build_stint_laps
+    def counting_build(*args, **kwargs):
+        builds.append(args)
+        return build_stint_laps(*args, **kwargs)
+    monkeypatch.setattr(gc, "build_stint_laps", counting_build)
+    return builds
+
+def curves_json(**overrides):
+    return gc.curves_to_json(gc.compute_curves(*SPAIN, gc.COMPOUNDS, **overrides))
+
+def test_hit_loads_no_laps(spain_cache, monkeypatch):
+    first = curves_json()
+    assert len(spain_cache) == 1
+
+    def no_laps(*args, **kwargs):
+        raise AssertionError("laps were loaded on a cache hit")
+    monkeypatch.setattr(gc, "build_stint_laps", no_laps)
+    monkeypatch.setattr(gc, "load_laps", no_laps)
+    monkeypatch.setattr(gc, "_stint_laps_by_session", {})
+    assert curves_json() == first
+
+def test_every_parameter_is_part_of_the_key():
+    params = gc.pipeline_params()
+    assert set(CHANGED) | {"version"} == set(params)
+    base = gc.curve_cache_path("digest", "SOFT", params)
+    keys = {gc.curve_cache_path("digest", "SOFT", {**params, name: value}) for name, value in CHANGED.items()}
+    keys.add(gc.curve_cache_path("digest", "SOFT", {**params, "version": params["version"] + 1}))
+    keys.add(gc.curve_cache_path("other", "SOFT", params))
+    keys.add(gc.curve_cache_path("digest", "HARD", params))
+    assert base not in keys and len(keys) == len(CHANGED) + 3
+
+def test_parameter_version_and_input_changes_miss(spain_cache, monkeypatch):
+    curves_json()
+    curves_json(threshold=1.05)
+    assert len(spain_cache) == 2
+
+    monkeypatch.setattr(gc, "PIPELINE_VERSION", gc.PIPELINE_VERSION + 1)
+    curves_json()
+    assert len(spain_cache) == 3
+    curves_json()
+    assert len(spain_cache) == 3
+
+    with open(gc.cached_path("stints_9534.json"), "a") as f:
+        f.write("\n")
+    curves_json()
+    assert len(spain_cache) == 4
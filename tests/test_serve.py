@@ -0,0 +1,33 @@
+import io
+import json
+import os
+
+import pytest
+
+import get_curves as gc
+from conftest import ROOT
+
+@pytest.fixture
+def server_state(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(gc, "_curve_results", {})
+    monkeypatch.setattr(gc, "RESULTS_DIR", str(tmp_path / "results"))
+    monkeypatch.setattr(gc, "refresh_catalog", lambda years, **kwargs: [])
+
+def serve(*requests):
+    stdout = io.StringIO()
+    gc.serve(io.StringIO("".join(json.dumps(request) + "\n" for request in requests)), stdout)
+    return [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+def test_unknown_event_is_an_error_and_not_cached(server_state):
+    reply, = serve({"country": "Nowhere", "year": 2024})
+    assert reply == {"error": "LookupError: no Practice sessions found for Nowhere 2024"}
+    assert gc._curve_results == {}
+    assert not os.path.exists(gc.RESULTS_DIR)
+
+def test_known_event_is_answered_and_kept(server_state):
+    first, again = serve({"country": "Spain", "year": 2024, "compounds": ["medium"]},
+                         {"country": "Spain", "year": 2024, "compounds": ["MEDIUM"]})
+    assert first == again
+    assert first["MEDIUM"]["success"]
+    assert list(gc._curve_results) == [("Spain", 2024, "Practice", "MEDIUM")]
@@ -0,0 +1,79 @@
+import os
+import shutil
+
+import pytest
+
+import get_curves as gc
+from conftest import CACHE
+
+START, END = gc.parse_time("2024-06-21T11:30:00+00:00"), gc.parse_time("2024-06-21T12:30:00+00:00")
+SETTLED = END + gc.SESSION_SETTLE_SECONDS
+SESSION = {"session_key": 9532, "date_start": "2024-06-21T11:30:00+00:00", "date_end": "2024-06-21T12:30:00+00:00"}
+FILES = ["stints_9532.json", "laps_9532.json"]
+
+def cache_files(fetched_at=None, mtime=None):
+    os.makedirs(gc.CACHE_DIR, exist_ok=True)
+    log = {}
+    for fname in FILES:
+        path = gc.write_cached_json(fname, [])
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        if fetched_at is not None:
+            log[fname] = fetched_at
+    return log
+
+def stale(session, log, now):
+    return [fname for _, fname in gc.sync_targets(session, log, now)]
+
+def test_session_not_started_is_skipped(fresh_cache):
+    assert stale(SESSION, {}, START - 1) == []
+    assert stale({"session_key": 9532}, {}, END) == []
+
+def test_missing_files_are_fetched(fresh_cache):
+    assert stale(SESSION, {}, START + 60) == FILES
+
+def test_files_fetched_after_settling_are_final(fresh_cache):
+    log = cache_files(fetched_at=SETTLED + 1)
+    assert stale(SESSION, log, SETTLED + 10 ** 7) == []
+
+def test_live_files_are_refreshed_at_most_every_live_refresh_seconds(fresh_cache):
+    log = cache_files(fetched_at=END - 10)
+    assert stale(SESSION, log, END - 10 + gc.LIVE_REFRESH_SECONDS - 1) == []
+    assert stale(SESSION, log, END - 10 + gc.LIVE_REFRESH_SECONDS) == FILES
+    # Without an end time the session never settles
+    assert stale({**SESSION, "date_end": None}, {name: SETTLED + 1 for name in FILES}, SETTLED + 10 ** 7) == FILES
+
+def test_files_without_log_entry_are_dated_by_mtime(fresh_cache):
+    cache_files(mtime=SETTLED + 1)
+    assert stale(SESSION, {}, SETTLED + 10 ** 7) == []
+    cache_files(mtime=END - 600)
+    assert stale(SESSION, {}, END) == FILES
+
+@pytest.fixture
+def spain_catalog(fresh_cache, stub_api, monkeypatch):
+    os.makedirs(gc.CACHE_DIR)
+    shutil.copy(os.path.join(CACHE, "sessions_Spain_Practice_2024.json"), gc.CACHE_DIR)
+    monkeypatch.setattr(gc, "refresh_catalog", lambda years, **kwargs: [])
+
+def test_sync_downloads_missing_files_once(spain_catalog):
+    fetched = gc.sync_cache([2024], now=SETTLED + 10 ** 6)
+    assert sorted(fname for _, fname in fetched) == sorted(
+        f"{kind}_{session}.json" for session in (9532, 9533, 9534) for kind in ("stints", "laps"))
+    assert gc.sync_cache([2024], now=SETTLED + 10 ** 7) == []
+
+def test_sync_refresh_invalidates_parsed_and_ingested_sessions(spain_catalog, monkeypatch):
+    gc.sync_cache([2024], now=SETTLED + 10 ** 6)
+    for fname in FILES:
+        gc.record_fetch(fname, END - 10)
+    monkeypatch.setattr(gc, "LAP_STORE", "sqlite")
+    gc.session_stint_laps(9532)
+    gc.session_stint_laps(9533)
+    ingested = "SELECT session_key FROM ingested_sessions ORDER BY session_key"
+    assert gc.lap_store().execute(ingested).fetchall() == [(9532,), (9533,)]
+
+    assert gc.sync_cache([2024], now=END + 30) == []
+    fetched = gc.sync_cache([2024], now=END + gc.LIVE_REFRESH_SECONDS)
+    assert sorted(fname for _, fname in fetched) == sorted(FILES)
+    assert [key[0] for key in gc._stint_laps_by_session] == [9533]
+    assert gc.lap_store().execute(ingested).fetchall() == [(9533,)]
+    gc.lap_store().close()